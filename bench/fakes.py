@@ -0,0 +1,231 @@
+# In-process fakes of the Sheets v4, Gmail, Jira and Bugzilla apis used by the benchmarks.
+# They implement just the calls the app does, keep the spreadsheet in memory (applying the batchUpdates to it)
+# and generate the issues from the query so that the same query always returns the same issues.
+# install() registers them in common.clients so the app uses them instead of the real services.
+
+import json
+from types import SimpleNamespace
+from urllib.parse import urlsplit, parse_qsl
+
+from bench import generators
+from common import clients
+
+class FakeRequest:
+    def __init__(self, execute, body=None):
+        self._execute = execute
+        self.body = body
+
+    def execute(self):
+        return self._execute()
+
+# the spreadsheet: title -> {'sheetId': int, 'rows': list of rows, each a list of cells as in the api}
+class FakeSpreadsheet:
+    def __init__(self, response):
+        # the modifiedTime in drive, changed by each write
+        self.version = 1
+        self.tabs = {}
+        for sheet in response['sheets']:
+            rows = [list(row.get('values', [])) for row in sheet['data'][0].get('rowData', [])]
+            self.tabs[sheet['properties']['title']] = {'sheetId': sheet['properties']['sheetId'], 'rows': rows}
+
+    def get(self, spreadsheetId=None, fields=None):
+        def execute():
+            sheets = [{'properties': {'title': title, 'sheetId': tab['sheetId']},
+                       'data': [{'rowData': [{'values': row} if len(row) > 0 else {} for row in tab['rows']]}]}
+                      for title, tab in self.tabs.items()]
+            # the real client parses the json of the response, so does the fake to have a comparable cost
+            return json.loads(json.dumps({'sheets': sheets}))
+        return FakeRequest(execute)
+
+    def batchUpdate(self, spreadsheetId=None, body=None):
+        return FakeRequest(lambda: self.apply(body['requests']), json.dumps(body))
+
+    def _rows(self, sheetId):
+        for tab in self.tabs.values():
+            if tab['sheetId'] == sheetId:
+                return tab['rows']
+        raise KeyError(sheetId)
+
+    @staticmethod
+    def _cell(row, col):
+        while len(row) <= col:
+            row.append({})
+        return row[col]
+
+    # the drive files().get(fileId, fields='modifiedTime') of the spreadsheet
+    def files(self):
+        return SimpleNamespace(get=lambda fileId=None, fields=None: FakeRequest(lambda: {'modifiedTime': f'version-{self.version}'}))
+
+    def apply(self, requests):
+        self.version += 1
+        for request in requests:
+            kind, params = next(iter(request.items()))
+            if kind == 'deleteDimension':
+                rng = params['range']
+                del self._rows(rng['sheetId'])[rng['startIndex']:rng['endIndex']]
+            elif kind == 'insertDimension':
+                rng = params['range']
+                rows = self._rows(rng['sheetId'])
+                rows[rng['startIndex']:rng['startIndex']] = [[] for _ in range(rng['endIndex'] - rng['startIndex'])]
+            elif kind == 'updateCells' and 'range' in params:
+                rng = params['range']
+                rows = self._rows(rng['sheetId'])
+                for rowIndex in range(rng['startRowIndex'], rng['endRowIndex']):
+                    if rowIndex < len(rows):
+                        rows[rowIndex] = []
+            elif kind == 'updateCells':
+                start = params['start']
+                rows = self._rows(start['sheetId'])
+                for offset, newRow in enumerate(params['rows']):
+                    while len(rows) <= start['rowIndex'] + offset:
+                        rows.append([])
+                    row = rows[start['rowIndex'] + offset]
+                    for col, value in enumerate(newRow.get('values', []), start['columnIndex']):
+                        cell = self._cell(row, col)
+                        cell.pop('userEnteredValue', None)
+                        cell.update(value)
+            elif kind == 'repeatCell':
+                rng = params['range']
+                rows = self._rows(rng['sheetId'])
+                for rowIndex in range(rng['startRowIndex'], rng['endRowIndex']):
+                    while len(rows) <= rowIndex:
+                        rows.append([])
+                    for col in range(rng['startColumnIndex'], rng['endColumnIndex']):
+                        self._cell(rows[rowIndex], col)['userEnteredFormat'] = params['cell']['userEnteredFormat']
+            elif kind != 'updateDimensionProperties':
+                raise ValueError(f'Unsupported request {kind}')
+        return {'replies': [{} for _ in requests]}
+
+class FakeGmail:
+    def __init__(self, seed=0):
+        self.seed = seed
+
+    def users(self):
+        return self
+
+    def messages(self):
+        return SimpleNamespace(list=self._list_messages)
+
+    def threads(self):
+        return SimpleNamespace(list=self._list_threads)
+
+    def _list_messages(self, userId=None, q='', maxResults=100, includeSpamTrash=False, pageToken=None, fields=None):
+        def execute():
+            threads = generators.gmail_threads(q, self.seed)
+            start = int(pageToken or 0)
+            res = {'messages': [{'threadId': thread} for thread in threads[start:start + maxResults]]}
+            if start + maxResults < len(threads):
+                res['nextPageToken'] = str(start + maxResults)
+            return res
+        return FakeRequest(execute)
+
+    def _list_threads(self, userId=None, q='', maxResults=100, includeSpamTrash=False, fields=None):
+        return FakeRequest(lambda: {'resultSizeEstimate': len(set(generators.gmail_threads(q, self.seed)))})
+
+    def new_batch_http_request(self, callback):
+        requests = []
+        def execute():
+            for request, requestId in requests:
+                callback(requestId, request.execute(), None)
+        return SimpleNamespace(add=lambda request, request_id: requests.append((request, request_id)), execute=execute)
+
+class FakeResultList(list):
+    def __init__(self, items, total):
+        super().__init__(items)
+        self.total = total
+
+class FakeJira:
+    def __init__(self, seed=0):
+        self.seed = seed
+
+    def search_issues(self, jql, startAt=0, maxResults=50, fields=None, json_result=False, expand=None):
+        if json_result:
+            issues = generators.jira_issues(jql, self.seed)
+            wanted = set((fields or '').split(','))
+            page = [{'key': issue['key'], 'fields': {name: value for name, value in issue['fields'].items() if name in wanted}}
+                    for issue in issues[startAt:startAt + maxResults]]
+            return {'startAt': startAt, 'maxResults': maxResults, 'total': len(issues), 'issues': page}
+
+        issues = generators.jira_issues_with_changelog(jql, seed=self.seed)
+        return FakeResultList(issues[startAt:startAt + maxResults], len(issues))
+
+class FakeResponse:
+    def __init__(self, data):
+        self.content = json.dumps(data).encode()
+
+    def json(self):
+        return json.loads(self.content)
+
+    def raise_for_status(self):
+        pass
+
+# the bugzilla rest api: /rest/bug?<query>&include_fields=...&limit=...&offset=...
+# A param given more times (product=a&product=b) returns the bugs of each of its values, as bugzilla ORs them.
+class FakeBugzilla:
+    PAGING_PARAMS = {'include_fields', 'limit', 'offset', 'order'}
+    # the params of the query which are also fields of the returned bugs
+    FIELD_PARAMS = {'product', 'component'}
+
+    def __init__(self, seed=0):
+        self.seed = seed
+        # the pages of one query are requested concurrently, the bugs are generated only once
+        self.cache = {}
+
+    def matching_bugs(self, params):
+        key = tuple(sorted((name, value) for name, value in params if name not in self.PAGING_PARAMS))
+        if key not in self.cache:
+            self.cache[key] = self.generate_bugs(params)
+        return self.cache[key]
+
+    def generate_bugs(self, params):
+        values = {}
+        for name, value in params:
+            if name not in self.PAGING_PARAMS:
+                values.setdefault(name, []).append(value)
+        queries = [[]]
+        for name in sorted(values):
+            queries = [query + [(name, value)] for query in queries for value in sorted(values[name])]
+        bugs = []
+        for query in queries:
+            for bug in generators.bugs('&'.join(f'{name}={value}' for name, value in query), self.seed):
+                bug.update((name, value) for name, value in query if name in self.FIELD_PARAMS)
+                bugs.append(bug)
+        return sorted(bugs, key=lambda bug: bug['id'])
+
+    def get(self, url, headers=None):
+        params = parse_qsl(urlsplit(url).query)
+        values = dict(params)
+        bugs = self.matching_bugs(params)
+        offset = int(values.get('offset', 0))
+        limit = int(values['limit']) if 'limit' in values else len(bugs)
+        fields = values.get('include_fields')
+        page = bugs[offset:offset + limit]
+        if fields is not None:
+            wanted = set(fields.split(','))
+            page = [{name: value for name, value in bug.items() if name in wanted} for bug in page]
+        return FakeResponse({'bugs': page, 'total_matches': len(bugs)})
+
+class FakeCredentials:
+    valid = True
+
+# the fakes currently installed, the benchmarks read the state of the spreadsheet from here
+installed = {}
+
+# makes the app use the fakes: the google apis are built by the fake build_google_service, jira and bugzilla
+# are registered as clients
+def install(spreadsheetResponse, seed=0):
+    installed['sheets'] = FakeSpreadsheet(spreadsheetResponse)
+    installed['gmail'] = FakeGmail(seed)
+
+    def build(serviceName, version, creds):
+        if serviceName == 'sheets':
+            return SimpleNamespace(spreadsheets=lambda: installed['sheets'])
+        if serviceName == 'drive':
+            return SimpleNamespace(files=lambda: installed['sheets'].files())
+        return installed[serviceName]
+
+    clients.build_google_service = build
+    clients.register('google-credentials', FakeCredentials())
+    clients.register('jira', FakeJira(seed))
+    clients.register('http-bugzilla', FakeBugzilla(seed))
+    return installed
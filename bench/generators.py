@@ -0,0 +1,137 @@
+# Generators of synthetic data for the benchmarks: the config and output tabs of the spreadsheet and the issues
+# returned by the fake jira, bugzilla and gmail. Everything is generated from a seed so the runs are comparable.
+
+import random
+import zlib
+from datetime import datetime, timezone
+from types import SimpleNamespace
+
+from common.constants import LABEL, TAB, QUERY, SPLIT_BY, SECTION, ID, STATEFUL, TIMESTAMP, INTERVAL
+
+STATUSES = ['NEW', 'ASSIGNED', 'POST', 'MODIFIED', 'ON_QA', 'VERIFIED', 'CLOSED']
+PRIORITIES = ['urgent', 'high', 'medium', 'low', 'unspecified']
+COMPONENTS = [f'component-{i}' for i in range(20)]
+CHANGED_FIELDS = ['status', 'assignee', 'priority', 'Fix Version', 'labels', 'description', 'Sprint']
+USERS = [f'user{i}' for i in range(10)]
+JIRA_OFFSET = '+0000'
+
+def rnd_for(text, seed=0):
+    return random.Random(zlib.crc32(text.encode()) ^ seed)
+
+def bold(value):
+    return {'userEnteredFormat': {'textFormat': {'bold': value}}}
+
+# one row of the spreadsheets.get response
+def row_data(values, formats=None):
+    cells = []
+    for col, value in enumerate(values):
+        cell = {}
+        if value != '':
+            cell['userEnteredValue'] = {'formulaValue': value} if value.startswith('=') else {'stringValue': value}
+        cell['userEnteredFormat'] = (formats[col] if formats is not None else bold(False))['userEnteredFormat']
+        cells.append(cell)
+    return {'values': cells}
+
+# rows of the config tab: numOfFilters filters spread evenly over the plugins and numOfTabs output tabs.
+# Every fifth jira filter is stateful and imports the state from the lastExecutedTimestamp: set a day ago.
+def config_rows(numOfFilters, numOfTabs, seed=0, now=None):
+    now = now if now is not None else datetime.now().timestamp()
+    rnd = random.Random(seed)
+    rows = [['plugin', 'params']]
+    for i in range(numOfFilters):
+        tab = f'{TAB} Tab{i % numOfTabs}'
+        label = f'{LABEL} filter {i}'
+        kind = i % 3
+        if kind == 0:
+            product = f'product{rnd.randrange(5)}'
+            rows.append(['bz-filter', label, tab, f'{QUERY} product={product}&component={rnd.choice(COMPONENTS)}', f'{SPLIT_BY} status', f'{INTERVAL} 10m'])
+        elif kind == 1 and (i // 3) % 5 == 4:
+            rows.append(['jira-filter', label, tab, f'{QUERY} project = P{rnd.randrange(5)}', 'maxResults: 300',
+                         f'{ID}f{i}', f'{STATEFUL} true', f'{TIMESTAMP} {now - 24 * 60 * 60}'])
+        elif kind == 1:
+            rows.append(['jira-filter', label, tab, f'{QUERY} project = P{rnd.randrange(5)} and priority = {rnd.choice(PRIORITIES)}', 'maxResults: 1000', f'{SPLIT_BY} fields.status.name'])
+        else:
+            rows.append(['gmail-filter', label, tab, f'{QUERY} from:{rnd.choice(USERS)} is:unread'])
+    return rows
+
+# the rows of an output tab: numOfSections sections, each with rowsPerSection results of split filters
+def output_rows(numOfSections, rowsPerSection, seed=0):
+    rnd = random.Random(seed)
+    rows = []
+    formats = []
+    for section in range(numOfSections):
+        rows.append([f'{SECTION} section-{section}'])
+        formats.append([{'userEnteredFormat': {'textFormat': {'bold': True}, 'backgroundColorStyle': {'rgbColor': {'red': 0.7176471, 'green': 0.7176471, 'blue': 0.7176471}}}}])
+        for row in range(rowsPerSection):
+            values = [f'filter {section}-{row}', f'=HYPERLINK("https://bugzilla.example.com/buglist.cgi?product=p{row}", "All: {rnd.randrange(1000)}")']
+            for status in rnd.sample(STATUSES, rnd.randrange(1, len(STATUSES))):
+                values.append(f'=HYPERLINK("https://bugzilla.example.com/buglist.cgi?f1=bug_id&o1=anyexact&v1={rnd.randrange(10 ** 6)}", "{status}: {rnd.randrange(100)}")')
+            rows.append(values)
+            formats.append([bold(col == 0) for col in range(len(values))])
+    return (rows, formats)
+
+# the whole spreadsheets.get response of a spreadsheet with the config tab and the output tabs
+def spreadsheet(configRows, outputTabs):
+    sheets = [{'properties': {'title': 'Config', 'sheetId': 0}, 'data': [{'rowData': [row_data(row) for row in configRows]}]}]
+    for sheetId, (title, (rows, formats)) in enumerate(outputTabs.items(), 1):
+        sheets.append({'properties': {'title': title, 'sheetId': sheetId}, 'data': [{'rowData': [row_data(row, rowFormats) for row, rowFormats in zip(rows, formats)]}]})
+    return {'sheets': sheets}
+
+def jira_time(timestamp):
+    dt = datetime.fromtimestamp(timestamp, timezone.utc)
+    return dt.strftime('%Y-%m-%dT%H:%M:%S.') + f'{dt.microsecond // 1000:03d}{JIRA_OFFSET}'
+
+# the jira issues satisfying the jql as json (as returned by search_issues(json_result=True))
+def jira_issues(jql, seed=0):
+    rnd = rnd_for(jql, seed)
+    project = f'P{rnd.randrange(100)}'
+    return [{'key': f'{project}-{i}',
+             'fields': {'status': {'name': rnd.choice(STATUSES)},
+                        'priority': {'name': rnd.choice(PRIORITIES)},
+                        'components': [{'name': rnd.choice(COMPONENTS)}]}}
+            for i in range(rnd.randrange(50, 2000))]
+
+# the jira issues with the changelog and comments changed during the last two days (as returned by search_issues(expand='changelog'))
+def jira_issues_with_changelog(jql, now=None, seed=0):
+    now = now if now is not None else datetime.now().timestamp()
+    rnd = rnd_for(jql, seed)
+    issues = []
+    for i in range(rnd.randrange(20, 300)):
+        histories = []
+        for _ in range(rnd.randrange(1, 10)):
+            items = [SimpleNamespace(field=rnd.choice(CHANGED_FIELDS)) for _ in range(rnd.randrange(1, 4))]
+            histories.append(SimpleNamespace(created=jira_time(now - rnd.uniform(0, 2 * 24 * 60 * 60)), items=items))
+        comments = [SimpleNamespace(created=jira_time(now - rnd.uniform(0, 2 * 24 * 60 * 60)), body=f'ping [~{rnd.choice(USERS)}]')
+                    for _ in range(rnd.randrange(0, 5))]
+        issues.append(SimpleNamespace(
+            key=f'P-{i}',
+            fields=SimpleNamespace(updated=max(history.created for history in histories), comment=SimpleNamespace(comments=comments)),
+            changelog=SimpleNamespace(histories=histories)))
+    return issues
+
+# the bugs satisfying the bugzilla query, each query has its own range of ids
+def bugs(query, seed=0):
+    rnd = rnd_for(query, seed)
+    firstId = 1000000 + (zlib.crc32(query.encode()) % 10000) * 100000
+    return [{'id': firstId + i * 7, 'status': rnd.choice(STATUSES), 'priority': rnd.choice(PRIORITIES), 'component': rnd.choice(COMPONENTS)}
+            for i in range(rnd.randrange(10, 3000))]
+
+# the thread ids of the messages satisfying the gmail query
+def gmail_threads(query, seed=0):
+    rnd = rnd_for(query, seed)
+    return [f'thread-{i // rnd.randrange(1, 4)}' for i in range(rnd.randrange(0, 2000))]
+
+# (key, (status, priority)) records as returned by the jira search, for split_issues
+def records(numOfIssues, seed=0):
+    rnd = random.Random(seed)
+    return [(f'P-{i}', (rnd.choice(STATUSES), rnd.choice(PRIORITIES))) for i in range(numOfIssues)]
+
+# the rows printed by the old versions of the stateful jira filter, for parse_prev_row
+def prev_jira_rows(numOfFields, issuesPerField, baseUrl, seed=0):
+    rnd = random.Random(seed)
+    rows = []
+    for field in range(numOfFields):
+        keys = [f'P-{rnd.randrange(10 ** 5)}' for _ in range(issuesPerField)]
+        urls = ''.join(f'"{baseUrl}/issues/?jql=key={key}", ' for key in keys)
+        rows.append(f'=HYPERLINK("{baseUrl}/issues/?jql=", "field{field}: " & COUNTA({urls}))')
+    return rows
@@ -0,0 +1,222 @@
+# Runs the benchmarks of the hot functions and of whole cycles against the fake apis (see bench/fakes.py), so no
+# real spreadsheet, jira, bugzilla or gmail is touched.
+# For each benchmark it reports the wall time (the best and the median of the runs), the api calls done
+# and the peak memory allocated (measured by tracemalloc in a separate run since it slows everything down).
+# The results are stored as json into bench/results/ and can be compared with a previous run:
+#   python -m bench.run
+#   python -m bench.run --only cycle-warm,split_issues --repeat 3
+#   python -m bench.run --compare bench/results/20260101-120000.json
+# With --compare the exit code is 1 if some benchmark is slower (or needs more memory) than REGRESSION_THRESHOLD.
+
+import getopt
+import json
+import logging
+import os
+import platform
+import statistics
+import sys
+import tempfile
+import time
+import tracemalloc
+from datetime import datetime
+
+REPO_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, REPO_DIR)
+
+from bench import fakes, generators
+from common import history, metrics, options, ratelimit, scheduler, snapshot, statestore
+from common.constants import SPLIT_BY, SECTION
+from common.helpers import split_issues
+import main as app
+from plugins import bz, gmail, jiraplugin
+
+RESULTS_DIR = os.path.join(REPO_DIR, 'bench', 'results')
+DEFAULT_REPEAT = 5
+# by how much (0.1 = 10%) a benchmark can be worse than the baseline before it is reported as a regression
+REGRESSION_THRESHOLD = 0.1
+
+# the size of the synthetic data
+NUM_OF_FILTERS = 300
+NUM_OF_TABS = 10
+NUM_OF_CONFIG_ROWS = 3000
+NUM_OF_SECTIONS = 200
+ROWS_PER_SECTION = 25
+NUM_OF_RECORDS = 100000
+PREV_ROW_FIELDS = 20
+PREV_ROW_ISSUES = 300
+UNLIMITED_RATES = 'sheets:100000,gmail:100000,jira:100000,bugzilla:100000'
+
+def api_calls():
+    return {f'{dict(labels)["service"]}.{dict(labels)["operation"]}': value for labels, value in metrics.get_counter('api_requests_total').items()}
+
+# runs the benchmark repeat times (each time after the setup) and returns its results
+def measure(run, setup=lambda: None, repeat=DEFAULT_REPEAT):
+    times = []
+    for _ in range(repeat):
+        setup()
+        metrics.reset()
+        start = time.perf_counter()
+        run()
+        times.append(time.perf_counter() - start)
+    calls = api_calls()
+
+    setup()
+    tracemalloc.start()
+    try:
+        run()
+        peak = tracemalloc.get_traced_memory()[1]
+    finally:
+        tracemalloc.stop()
+
+    return {'seconds': min(times), 'median_seconds': statistics.median(times), 'peak_bytes': peak, 'api_calls': calls}
+
+def output_tab():
+    rows, formats = generators.output_rows(NUM_OF_SECTIONS, ROWS_PER_SECTION)
+    return [generators.row_data(row, rowFormats) for row, rowFormats in zip(rows, formats)]
+
+def bench_normalize_data_and_format(repeat):
+    rowData = output_tab()
+    return measure(lambda: app.normalize_data_and_format(rowData), repeat=repeat)
+
+def bench_load_config(repeat):
+    response = generators.spreadsheet(generators.config_rows(NUM_OF_CONFIG_ROWS, NUM_OF_TABS), {})
+    _, tabsData = app.split_spreadsheet_per_tab(response)
+    modules = {plugin.get_config_key(): plugin for plugin in (bz, gmail, jiraplugin)}
+    return measure(lambda: app.load_confg(tabsData, modules), repeat=repeat)
+
+def bench_split_issues(repeat):
+    records = generators.records(NUM_OF_RECORDS)
+    config = {'label:': 'bench', SPLIT_BY: 'fields.status.name,fields.priority.name'}
+    dimensionIndex = {'fields.status.name': 0, 'fields.priority.name': 1}
+    return measure(lambda: split_issues(config, records, 'https://jira.example.com', jiraplugin.create_queries, lambda issue: issue[0], lambda issue, splitBy: issue[1][dimensionIndex[splitBy]]), repeat=repeat)
+
+def bench_parse_prev_row(repeat):
+    rows = generators.prev_jira_rows(PREV_ROW_FIELDS, PREV_ROW_ISSUES, jiraplugin.JIRA_BASE_URL)
+    return measure(lambda: jiraplugin.parse_prev_row(rows), repeat=repeat)
+
+# refreshes a large tab where every tenth section has new results
+def bench_refresh_spreadsheet(repeat):
+    rows, formats = generators.output_rows(NUM_OF_SECTIONS, ROWS_PER_SECTION)
+    response = generators.spreadsheet([], {'Tab0': (rows, formats)})
+    newRows, _ = generators.output_rows(NUM_OF_SECTIONS, ROWS_PER_SECTION, seed=1)
+    toUpdate = {}
+    section = None
+    for index, row in enumerate(newRows):
+        if row[0].startswith(SECTION):
+            section = row[0][len(SECTION):].strip()
+            if index % (10 * (ROWS_PER_SECTION + 1)) == 0:
+                toUpdate[section] = []
+        elif section in toUpdate:
+            toUpdate[section].append(row)
+
+    ratelimit.configure(dict(rate.split(':') for rate in UNLIMITED_RATES.split(',')))
+    state = {}
+    def setup():
+        fakes.install(response)
+        sheetMetadata, tabsData = app.load_spreadsheet(None)
+        state['args'] = (toUpdate, 'Tab0', sheetMetadata, tabsData['Tab0'])
+    return measure(lambda: app.write_to_spreadsheet(None, app.refresh_spreadsheet(*state['args'])[2]), setup, repeat)
+
+# main() runs in a temporary directory with the bugzilla api key, the state is kept there as well
+def prepare_cycle_dir():
+    workDir = tempfile.mkdtemp(prefix='siall-bench-')
+    with open(os.path.join(workDir, 'bz.apikey'), 'w') as apiKey:
+        apiKey.write('bench\n')
+    return workDir
+
+def run_main(workDir):
+    # the fakes have no quota, the rate limits would only add sleeping to the measured time
+    sys.argv = ['main.py', '--jiratoken', 'bench', '--state-file', os.path.join(workDir, 'state.sqlite'),
+                '--snapshot-file', os.path.join(workDir, 'snapshot.bin'), '--history-file', os.path.join(workDir, 'history.bin'),
+                '--rate-limits', UNLIMITED_RATES]
+    options._options = None
+    cwd = os.getcwd()
+    os.chdir(workDir)
+    try:
+        app.main()
+    finally:
+        os.chdir(cwd)
+
+def new_cycle_state(workDir):
+    for file in ('state.sqlite', 'snapshot.bin', 'history.bin'):
+        if os.path.exists(os.path.join(workDir, file)):
+            os.remove(os.path.join(workDir, file))
+    statestore.configure(os.path.join(workDir, 'state.sqlite'))
+    snapshot.configure(os.path.join(workDir, 'snapshot.bin'))
+    history.configure(os.path.join(workDir, 'history.bin'))
+    scheduler.retain([])
+    emptyTabs = {f'Tab{i}': ([], []) for i in range(NUM_OF_TABS)}
+    fakes.install(generators.spreadsheet(generators.config_rows(NUM_OF_FILTERS, NUM_OF_TABS), emptyTabs))
+
+# the first cycle: all the output tabs are empty, all the stateful filters import their state
+def bench_cycle_cold(repeat):
+    workDir = prepare_cycle_dir()
+    return measure(lambda: run_main(workDir), lambda: new_cycle_state(workDir), repeat)
+
+# the next cycle: the tabs already contain the results of the previous one (which has written them, so it loads them again)
+def bench_cycle_warm(repeat):
+    workDir = prepare_cycle_dir()
+    def setup():
+        new_cycle_state(workDir)
+        run_main(workDir)
+        scheduler.retain([])
+    return measure(lambda: run_main(workDir), setup, repeat)
+
+BENCHMARKS = {
+    'normalize_data_and_format': bench_normalize_data_and_format,
+    'load_confg': bench_load_config,
+    'split_issues': bench_split_issues,
+    'parse_prev_row': bench_parse_prev_row,
+    'refresh_spreadsheet': bench_refresh_spreadsheet,
+    'cycle-cold': bench_cycle_cold,
+    'cycle-warm': bench_cycle_warm,
+}
+
+def compare(results, baseline):
+    regressions = []
+    print(f'{"benchmark":28} {"seconds":>10} {"baseline":>10} {"ratio":>7} {"peak MB":>9} {"baseline":>9}')
+    for name, result in results.items():
+        base = baseline['results'].get(name)
+        if base is None:
+            print(f'{name:28} {result["seconds"]:10.4f} {"-":>10}')
+            continue
+        ratio = result['seconds'] / base['seconds'] if base['seconds'] > 0 else 1
+        print(f'{name:28} {result["seconds"]:10.4f} {base["seconds"]:10.4f} {ratio:7.2f} {result["peak_bytes"] / 2 ** 20:9.2f} {base["peak_bytes"] / 2 ** 20:9.2f}')
+        if ratio > 1 + REGRESSION_THRESHOLD or result['peak_bytes'] > base['peak_bytes'] * (1 + REGRESSION_THRESHOLD):
+            regressions.append(name)
+        if result['api_calls'] != base['api_calls']:
+            print(f'{"":28} api calls changed: {base["api_calls"]} -> {result["api_calls"]}')
+    return regressions
+
+def run():
+    opts, _ = getopt.getopt(sys.argv[1:], '', ['only=', 'repeat=', 'compare=', 'output='])
+    opts = dict(opts)
+    names = [name for name in opts.get('--only', ','.join(BENCHMARKS)).split(',') if name]
+    repeat = int(opts.get('--repeat', DEFAULT_REPEAT))
+    outputPath = opts.get('--output', os.path.join(RESULTS_DIR, f'{datetime.now().strftime("%Y%m%d-%H%M%S")}.json'))
+    argv = sys.argv
+
+    # main() logs every step, only the results are interesting here
+    logging.disable(logging.INFO)
+    results = {}
+    try:
+        for name in names:
+            results[name] = BENCHMARKS[name](repeat)
+            print(f'{name:28} {results[name]["seconds"]:10.4f}s  peak {results[name]["peak_bytes"] / 2 ** 20:8.2f}MB  api calls {results[name]["api_calls"]}')
+    finally:
+        sys.argv = argv
+
+    os.makedirs(os.path.dirname(os.path.abspath(outputPath)), exist_ok=True)
+    with open(outputPath, 'w') as output:
+        json.dump({'timestamp': time.time(), 'python': platform.python_version(), 'repeat': repeat, 'results': results}, output, indent=2)
+    print(f'Results stored to {outputPath}')
+
+    if '--compare' in opts:
+        with open(opts['--compare']) as baselineFile:
+            regressions = compare(results, json.load(baselineFile))
+        if len(regressions) > 0:
+            print(f'Regressions: {", ".join(regressions)}')
+            sys.exit(1)
+
+if __name__ == '__main__':
+    run()
@@ -0,0 +1,46 @@
+# Splits the requests of a spreadsheets.batchUpdate into bodies which fit into the size limits of the api.
+# The requests keep their order so sending the bodies one after another has the same effect as sending
+# all of them at once (except that it is not atomic anymore).
+
+import json
+
+# the sheets api rejects too large payloads, stay well below the limit
+MAX_BATCH_BYTES = 2 * 1024 * 1024
+
+def _size(request):
+    return len(json.dumps(request))
+
+# an updateCells request with too many rows is split into more requests, each writing a part of the rows
+def _split_large(request, maxBytes):
+    updateCells = request.get('updateCells', {})
+    rows = updateCells.get('rows', [])
+    if len(rows) < 2 or 'start' not in updateCells or _size(request) <= maxBytes:
+        return [request]
+
+    half = len(rows) // 2
+    res = []
+    for offset, part in ((0, rows[:half]), (half, rows[half:])):
+        start = dict(updateCells['start'])
+        start['rowIndex'] = start.get('rowIndex', 0) + offset
+        res.extend(_split_large({'updateCells': dict(updateCells, start=start, rows=part)}, maxBytes))
+    return res
+
+# returns a list of batchUpdate bodies ({'requests': [...]}) each of them at most maxBytes large
+# (unless a single request is larger than that and can not be split)
+def split_requests(requests, maxBytes=MAX_BATCH_BYTES):
+    bodies = []
+    current = []
+    currentSize = 0
+    for request in requests:
+        for part in _split_large(request, maxBytes):
+            size = _size(part)
+            if len(current) > 0 and currentSize + size > maxBytes:
+                bodies.append({'requests': current})
+                current = []
+                currentSize = 0
+            current.append(part)
+            currentSize += size
+
+    if len(current) > 0:
+        bodies.append({'requests': current})
+    return bodies
@@ -0,0 +1,215 @@
+# a registry of the clients used to talk to the outside world (google apis, jira, bugzilla...)
+# Each client is created once and reused for the whole life of the process instead of being created for every call.
+# The client libraries are heavy to import, so they are imported only once the client is needed.
+
+import logging
+import random
+import threading
+import time
+from common import credentials, metrics, ratelimit, tracing
+
+# how many keep-alive connections are kept open per host
+HTTP_POOL_SIZE = 16
+
+# how many times a call is tried before the error is given up on
+MAX_ATTEMPTS = 8
+# the delay before the first retry, doubled by each next one up to MAX_RETRY_DELAY
+RETRY_DELAY = 1
+MAX_RETRY_DELAY = 64
+# the service is overloaded or asks us to slow down, worth to try again later
+RETRYABLE_STATUSES = {429, 500, 502, 503, 504}
+
+_lock = threading.Lock()
+_clients = {}
+_creationLocks = {}
+_threadClients = threading.local()
+# size: the size of the body of the last response received by the thread, see received_size
+_received = threading.local()
+
+# returns the client registered under the name, creating it by the factory if it does not exist yet.
+# The client is shared by all threads. If the factory returns None (e.g. failed to login), nothing is remembered
+# and the next call tries again.
+def get(name, factory):
+    with _lock:
+        if name in _clients:
+            return _clients[name]
+        if name not in _creationLocks:
+            _creationLocks[name] = threading.Lock()
+        creationLock = _creationLocks[name]
+
+    # creating a client can be slow (e.g. login) so only the callers asking for the same client wait for it
+    with creationLock:
+        if name not in _clients:
+            client = factory()
+            if client is None:
+                return None
+            with _lock:
+                _clients[name] = client
+        return _clients[name]
+
+# registers an already created client under the name, e.g. a fake one used by the benchmarks
+def register(name, client):
+    with _lock:
+        _clients[name] = client
+
+# same as get() but the client is created once per thread. Used for clients which are not thread safe
+# (e.g. the google api clients which are built on top of httplib2)
+def get_for_thread(name, factory):
+    clients = getattr(_threadClients, 'clients', None)
+    if clients is None:
+        clients = {}
+        _threadClients.clients = clients
+    if name not in clients:
+        client = factory()
+        if client is None:
+            return None
+        clients[name] = client
+    return clients[name]
+
+def google_credentials():
+    return get('google-credentials', credentials.google)
+
+def build_google_service(serviceName, version, creds):
+    from googleapiclient.discovery import build
+    return build(serviceName, version, credentials=creds, cache_discovery=False)
+
+# returns the google api service (e.g. 'sheets', 'v4') built with the given or the default credentials.
+# If different credentials are given than the ones the service has been built with, it is built again.
+def google_service(serviceName, version, creds=None):
+    if creds is None:
+        creds = google_credentials()
+    name = f'google-{serviceName}-{version}'
+    service = get_for_thread(name, lambda: (creds, build_google_service(serviceName, version, creds)))
+    if service[0] is not creds:
+        service = (creds, build_google_service(serviceName, version, creds))
+        _threadClients.clients[name] = service
+    return service[1]
+
+def _create_http_session():
+    import requests
+    from requests.adapters import HTTPAdapter
+    session = requests.Session()
+    adapter = HTTPAdapter(pool_connections=HTTP_POOL_SIZE, pool_maxsize=HTTP_POOL_SIZE)
+    session.mount('https://', adapter)
+    session.mount('http://', adapter)
+    return session
+
+# a keep-alive http session. Each name (e.g. 'bugzilla') gets its own session.
+def http_session(name):
+    return get(f'http-{name}', _create_http_session)
+
+# returns (http status, Retry-After header) of the error raised by one of the clients, None for what is not known
+# (googleapiclient: HttpError.resp, requests: HTTPError.response, jira: JIRAError.status_code and .response)
+def _error_status(e):
+    status = getattr(e, 'status_code', None)
+    response = getattr(e, 'response', None)
+    if response is None:
+        response = getattr(e, 'resp', None)
+    if response is None:
+        return (status, None)
+    if status is None:
+        status = getattr(response, 'status_code', getattr(response, 'status', None))
+    headers = getattr(response, 'headers', response)
+    retryAfter = headers.get('retry-after') if hasattr(headers, 'get') else None
+    return (status, retryAfter)
+
+def _parse_retry_after(value):
+    if value is None:
+        return None
+    try:
+        return max(0.0, float(value))
+    except ValueError:
+        pass
+    # the date format is rare, its parser is not worth importing up front
+    from email.utils import parsedate_to_datetime
+    try:
+        return max(0.0, parsedate_to_datetime(value).timestamp() - time.time())
+    except (TypeError, ValueError):
+        return None
+
+# Returns (how long to wait before trying again, whether the service asked to slow down) or None if the error
+# is not worth retrying. The delay grows exponentially with the attempt and is randomized so that the callers
+# which failed at the same time do not retry at the same time again. Retry-After sent by the service wins.
+# idempotent: False for the calls which must not be done twice (e.g. a batchUpdate inserting rows), they are retried
+# only if the service has told it has not processed them (429, or 503 with Retry-After); after a network error or
+# another 5xx it is not known whether they have been applied.
+def retry_delay(e, attempt, idempotent=True):
+    status, retryAfter = _error_status(e)
+    if status is None and not isinstance(e, OSError):
+        # not an http error nor a network one, e.g. a bug or an invalid query
+        return None
+    if status is not None and int(status) not in RETRYABLE_STATUSES:
+        return None
+    if not idempotent and not (status is not None and (int(status) == 429 or (int(status) == 503 and retryAfter is not None))):
+        return None
+
+    retryAfter = _parse_retry_after(retryAfter)
+    if retryAfter is not None:
+        return (retryAfter + random.uniform(0, RETRY_DELAY), True)
+    delay = min(MAX_RETRY_DELAY, RETRY_DELAY * 2 ** attempt)
+    return (random.uniform(delay / 2, delay), status is not None and int(status) == 429)
+
+# Every call to the outside world goes through here so that all of them are measured, kept within the rate limit
+# of the service and retried the same way.
+# service/operation: e.g. 'sheets'/'batchUpdate', used as the labels of the metrics
+# send: function with no args doing the call and returning its result
+# sentBytes: the size of what is sent
+# receivedBytes: function taking the result and returning its size, None if it is not known
+# requests: how many api requests the call consists of (e.g. a batch of gmail requests)
+# priority: ratelimit.PRIORITY_WRITE for calls changing something, they go before the reads waiting for the same service
+# idempotent: whether the call can be safely done again if it is not known whether it has been applied, see retry_delay
+def call(service, operation, send, sentBytes=0, receivedBytes=None, requests=1, priority=ratelimit.PRIORITY_READ, idempotent=True):
+    labels = {'service': service, 'operation': operation}
+    for attempt in range(MAX_ATTEMPTS):
+        waited = ratelimit.acquire(service, requests, priority)
+        if waited > 0:
+            metrics.observe('api_throttled_seconds', labels, waited)
+
+        start = time.perf_counter()
+        _received.size = 0
+        try:
+            with tracing.span(f'{service}.{operation}', 'api', {'attempt': attempt} if attempt > 0 else None):
+                result = send()
+        except Exception as e:
+            metrics.inc('api_errors_total', labels)
+            retry = retry_delay(e, attempt, idempotent)
+            if retry is None or attempt == MAX_ATTEMPTS - 1:
+                raise
+            delay, throttled = retry
+            metrics.inc('api_retries_total', labels)
+            logging.warning(f'Call of {service} {operation} failed ({e}), trying again in {delay:.1f}s')
+            if throttled:
+                # the service is over its quota for everyone, not only for this call
+                ratelimit.block(service, delay)
+            else:
+                time.sleep(delay)
+            continue
+        finally:
+            metrics.observe('api_call_seconds', labels, time.perf_counter() - start)
+            metrics.inc('api_requests_total', labels, requests)
+            metrics.inc('api_sent_bytes_total', labels, sentBytes)
+
+        if receivedBytes is not None:
+            metrics.inc('api_received_bytes_total', labels, receivedBytes(result))
+        return result
+
+# the size of the body of the last response received by the calling thread, as counted by count_response or
+# execute_google; receivedBytes of call() for the clients which return the parsed response only
+def received_size(result):
+    return getattr(_received, 'size', 0)
+
+# a response hook of a requests session (e.g. the one of the jira client) counting the size of the responses
+def count_response(response, *args, **kwargs):
+    _received.size = len(response.content)
+
+# executes the request of a google api client, e.g. execute_google('sheets', 'get', sheet.get(...))
+def execute_google(service, operation, request, priority=ratelimit.PRIORITY_READ, idempotent=True):
+    body = getattr(request, 'body', None)
+    postproc = getattr(request, 'postproc', None)
+    if postproc is not None:
+        # the raw body is seen only by the postprocessing which parses it
+        def counted(response, content):
+            _received.size = len(content)
+            return postproc(response, content)
+        request.postproc = counted
+    return call(service, operation, request.execute, len(body) if body else 0, received_size, priority=priority, idempotent=idempotent)
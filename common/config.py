@@ -0,0 +1,96 @@
+# The config tab compiled into a model of the filters of each plugin and the output tabs they are written to.
+# The rows are validated once when the model is built, the invalid ones are reported and skipped instead of failing
+# later in the middle of a cycle. The model is kept between cycles and built again only if the content
+# of the config tab has changed.
+
+import hashlib
+import logging
+import pickle
+from dataclasses import dataclass, field
+
+from common.constants import LABEL, TAB, QUERY, ID, STATEFUL, RAW_ROW
+
+# the params each filter needs to have unless the plugin says otherwise by get_required_params(). They also need to
+# have a value, except of those which the plugin accepts empty by get_empty_params(config).
+DEFAULT_REQUIRED_PARAMS = [LABEL, TAB, QUERY]
+
+@dataclass
+class Config:
+    # plugin name -> the filters (the parsed rows) of the plugin in the order of the config tab
+    filters: dict = field(default_factory=dict)
+    # the output tabs in the order in which they appear in the config
+    tabs: list = field(default_factory=list)
+    # the messages about the rows which have been skipped because they are invalid
+    errors: list = field(default_factory=list)
+
+_cache = {'key': None, 'config': None}
+
+# Returns {param: value} of the cells of the row starting by one of the params (e.g. 'label: x' -> {'label:': 'x'}).
+# Each cell is looked up only once by the text up to its first ':', so it does not matter how many params there are.
+# If the formats of the rows are given, the format of each param is added as 'param-format'.
+def parse_row(row, params, formattedRow = None, rowid = -1):
+    if not isinstance(params, (set, frozenset, dict)):
+        params = set(params)
+    res = {}
+    for colid, col in enumerate(row):
+        param = col[:col.find(':') + 1]
+        if param in params:
+            res[param] = col[len(param):].strip()
+            if formattedRow is not None:
+                res[param + '-format'] = formattedRow[rowid][colid]
+    res[RAW_ROW] = row
+
+    return res
+
+# the messages about what is wrong with the filter, empty if it is valid
+def validate(plugin, pluginConfig):
+    required = plugin.get_required_params() if hasattr(plugin, 'get_required_params') else DEFAULT_REQUIRED_PARAMS
+    canBeEmpty = plugin.get_empty_params(pluginConfig) if hasattr(plugin, 'get_empty_params') else []
+    errors = [f'missing {param}' for param in required if param not in pluginConfig or (pluginConfig[param] == '' and param not in canBeEmpty)]
+    if pluginConfig.get(STATEFUL, 'false') == 'true' and pluginConfig.get(ID, '') == '':
+        errors.append(f'{STATEFUL} true needs {ID}')
+    if hasattr(plugin, 'validate_config'):
+        errors.extend(plugin.validate_config(pluginConfig))
+    return errors
+
+# pickle is way faster than json here; if it ever serialized the same content differently, the model would only
+# be built again
+def _content_key(data, formats, plugins):
+    return hashlib.sha1(pickle.dumps((data, formats, sorted(plugins)))).hexdigest()
+
+def _build(data, formats, plugins):
+    config = Config(filters={plugin_name: [] for plugin_name in plugins})
+    params = {plugin_name: frozenset(plugins[plugin_name].get_config_params()) for plugin_name in plugins}
+    filterIds = set()
+    tabs = {}
+    for rowid, row in enumerate(data):
+        if len(row) == 0 or row[0] not in plugins:
+            continue
+        plugin_name = row[0]
+        pluginConfig = parse_row(row, params[plugin_name], formats, rowid)
+        errors = validate(plugins[plugin_name], pluginConfig)
+        filterId = pluginConfig.get(ID)
+        if filterId is not None and filterId in filterIds:
+            errors.append(f'duplicate {ID} {filterId}')
+        if len(errors) > 0:
+            config.errors.append(f'Row {rowid + 1} of the {plugin_name} in the config is ignored: {", ".join(errors)}')
+            continue
+
+        config.filters[plugin_name].append(pluginConfig)
+        if filterId is not None:
+            filterIds.add(filterId)
+        tabs[pluginConfig[TAB]] = True
+    config.tabs = list(tabs)
+    return config
+
+# Returns the Config of the config tab given as its (data, formats), reusing the one from the previous cycle
+# if the tab has not changed.
+def load_config(data, formats, plugins):
+    key = _content_key(data, formats, plugins)
+    if _cache['key'] != key:
+        config = _build(data, formats, plugins)
+        for error in config.errors:
+            logging.error(error)
+        _cache['key'] = key
+        _cache['config'] = config
+    return _cache['config']
@@ -4,6 +4,9 @@ SPREADSHEET_ID = '1JAZXnfmyx8yQ3yeBcKORfMn9sGot-VzWPHUVPJRhPNg'
 # dev
 # SPREADSHEET_ID = '1vXVGYBpR4szN5zcee15GBoXKfpqFwG9A82yp2szYdnU'
 
+# the tab containing the config of all the filters
+CONFIG_TAB = 'Config'
+
 # PUBLIC PARAMETERS
 # generic parameters
 # label: the label printed next to it
@@ -12,23 +15,39 @@ LABEL = 'label:'
 TAB = 'tab:'
 # query: filter query it has to satisfy
 QUERY = 'query:'
+# interval: how often the filter is executed when running as a daemon, e.g. 90s, 5m, 1h (default 10m)
+INTERVAL = 'interval:'
 STATUS_SUCCESS = 'Success'
 STATUS_ERROR = 'ERROR'
-# bugzilla specific parameters
+# bugzilla and jira parameters
 # how the result should be split (e.g. by status/priority/severity)
+# more comma separated fields split it by each of them, nested in the given order (e.g. splitBy: status,priority)
 SPLIT_BY = 'splitBy:'
 
-# short the results in this order
+# short the results in this order (the values of all the fields of the splitBy)
 SORT = 'sort:'
+# show the trend of the number of issues over the given time (e.g. 30d) as a sparkline next to it,
+# computed from the counts of the previous cycles kept in the local history
+TREND = 'trend:'
+# jira specific parameters
+# max number of issues loaded by the filter
+MAX_RESULTS = 'maxResults:'
+# gmail specific parameters
+# how the messages satisfying the filter are counted:
+#   count: exact - pages through all the messages and counts the unique threads (default)
+#   count: estimate - uses the estimate of the number of threads gmail returns, way cheaper for large results
+COUNT = 'count:'
 # INTERNAL CONSTANTS
 # Section of output
 SECTION = 'section:'
 RAW_ROW = 'rawRow'
 
 ID = 'id:'
+# only imported into the state store (see common/statestore.py) when the filter is not there yet, never written
 TIMESTAMP = 'lastExecutedTimestamp:'
 STATEFUL = 'stateful:'
 RES = 'res:'
+CHANGES = 'changes:'
 
 # stateful jira
 IGNORE_FIELDS = 'ignoreFields:'
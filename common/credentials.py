@@ -0,0 +1,77 @@
+# The credentials of all the services, loaded once per process and kept in memory.
+# The google credentials are refreshed by a background thread a while before they expire, so that no request
+# needs to wait for the refresh, and the refreshed token is saved so that the next run starts with it.
+
+import copy
+import logging
+import os
+import threading
+import time
+from datetime import datetime, timezone
+
+from common.options import get_option
+
+# how long before the expiry the google token is refreshed
+REFRESH_AHEAD = 5 * 60
+# how long to wait before trying again if the refresh fails
+REFRESH_RETRY = 60
+BZ_API_KEY_FILE = 'bz.apikey'
+
+_lock = threading.Lock()
+_state = {'google': None, 'refresher': None}
+
+# the google credentials shared by all the google api clients
+def google():
+    with _lock:
+        if _state['google'] is None:
+            from common.googleapi import authenticate_google
+            _state['google'] = authenticate_google()
+            _start_refresher()
+        return _state['google']
+
+def _seconds_until_refresh(creds):
+    if creds.expiry is None:
+        return None
+    # the expiry of the google credentials is a naive datetime in utc
+    return (creds.expiry - datetime.now(timezone.utc).replace(tzinfo=None)).total_seconds() - REFRESH_AHEAD
+
+def _refresh_loop():
+    from common.googleapi import refresh_credentials
+    wait = _seconds_until_refresh(_state['google'])
+    while wait is not None:
+        time.sleep(max(wait, 0))
+        creds = _state['google']
+        try:
+            # a copy is refreshed so that nobody waits for the request, only the new token is swapped in
+            refreshed = copy.copy(creds)
+            refresh_credentials(refreshed)
+            with _lock:
+                creds.token = refreshed.token
+                creds.expiry = refreshed.expiry
+            logging.info('Google credentials refreshed')
+            wait = _seconds_until_refresh(creds)
+        except Exception as e:
+            # the request path still refreshes the token by itself if it expires in the meantime
+            logging.warning(f'Refreshing the google credentials failed, trying again in {REFRESH_RETRY}s: {e}')
+            wait = REFRESH_RETRY
+
+def _start_refresher():
+    if _state['refresher'] is None and getattr(_state['google'], 'refresh_token', None) is not None:
+        _state['refresher'] = threading.Thread(target=_refresh_loop, name='credentials-refresher', daemon=True)
+        _state['refresher'].start()
+
+def jira_token():
+    return get_option('jiratoken')
+
+# the bugzilla api key from the bz.apikey file, read only once. None if it is not available.
+def bugzilla_api_key():
+    with _lock:
+        if 'bugzilla' not in _state:
+            key = None
+            if os.path.exists(BZ_API_KEY_FILE):
+                with open(BZ_API_KEY_FILE, 'r') as apiKey:
+                    key = apiKey.readline().strip() or None
+            if key is None:
+                logging.error('Problem loading bugzilla API key. Please login to bugzilla web interface, go to Preferences->API Keys, generate a new one and paste it into a file named bz.apikey next to this file.')
+            _state['bugzilla'] = key
+        return _state['bugzilla']
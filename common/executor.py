@@ -0,0 +1,67 @@
+import threading
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor
+
+# how many jobs can run at the same time in total
+DEFAULT_MAX_WORKERS = 8
+# how many jobs of one group (e.g. plugin) can run at the same time
+DEFAULT_MAX_WORKERS_PER_GROUP = 4
+
+_poolsLock = threading.Lock()
+# max workers -> the pool. The pools are kept for the whole life of the process so that the next cycles of a daemon
+# reuse their threads together with the clients created once per thread (see clients.get_for_thread).
+_pools = {}
+
+def _pool(maxWorkers):
+    with _poolsLock:
+        if maxWorkers not in _pools:
+            _pools[maxWorkers] = ThreadPoolExecutor(max_workers=maxWorkers)
+        return _pools[maxWorkers]
+
+# Runs the jobs concurrently and returns their results in the same order as the jobs have been given, regardless
+# of the order in which they have finished.
+# jobs: list of (group, callable) tuples. At most maxWorkersPerGroup(group) jobs of the same group run at the same time
+# and at most maxWorkers jobs run at the same time in total.
+# If some of the jobs fails, the exception is re-raised once all the jobs have finished.
+def execute_concurrently(jobs, maxWorkers=DEFAULT_MAX_WORKERS, maxWorkersPerGroup=lambda group: DEFAULT_MAX_WORKERS_PER_GROUP):
+    if len(jobs) == 0:
+        return []
+
+    waiting = {}
+    for index, (group, _) in enumerate(jobs):
+        if group not in waiting:
+            waiting[group] = deque()
+        waiting[group].append(index)
+
+    running = {group: 0 for group in waiting}
+    limits = {group: max(1, maxWorkersPerGroup(group)) for group in waiting}
+    futures = [None] * len(jobs)
+    remaining = [len(jobs)]
+    # re-entrant since a callback of an already finished future is called directly from the submitting thread
+    lock = threading.RLock()
+    allDone = threading.Condition(lock)
+
+    executor = _pool(max(1, maxWorkers))
+    # the jobs are submitted only when their group has a free slot so that a job waiting for its group
+    # does not occupy one of the global workers
+    def submit_ready():
+        for group, queue in waiting.items():
+            while queue and running[group] < limits[group]:
+                index = queue.popleft()
+                running[group] += 1
+                futures[index] = executor.submit(jobs[index][1])
+                futures[index].add_done_callback(lambda _, group=group: finished(group))
+
+    def finished(group):
+        with lock:
+            running[group] -= 1
+            remaining[0] -= 1
+            submit_ready()
+            allDone.notify_all()
+
+    with lock:
+        submit_ready()
+        while remaining[0] > 0:
+            allDone.wait()
+
+    return [future.result() for future in futures]
@@ -0,0 +1,19 @@
+# Where the files of the app are kept and how they are written.
+
+import os
+
+# the directory of main.py
+APP_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+# the file of the given name next to main.py. The state kept by the app (e.g. the state of the stateful filters, the
+# history) is found there regardless of the working directory, e.g. also when started by cron.
+def app_path(name):
+    return os.path.join(APP_DIR, name)
+
+# Writes the content (str, or bytes with mode 'wb') into the file through a temporary file which then replaces it
+# at once, so whoever reads the file (or the next run after a crash) never sees it half written.
+def write_atomically(path, content, mode='w'):
+    tmpPath = f'{path}.tmp'
+    with open(tmpPath, mode) as file:
+        file.write(content)
+    os.replace(tmpPath, path)
@@ -0,0 +1,55 @@
+# Turns the per-cell formats into as few repeatCell requests as possible.
+# Neighbouring cells with the same format are merged into one rectangle: first the runs of equal formats inside
+# each row, than the same runs on consecutive rows. So for example a section row or a block of rows using only the
+# default format ends up as one request instead of one request per cell.
+
+from common.formatting import format_key
+
+def _runs(rowFormats, formatKeys):
+    runs = []
+    for col, format in enumerate(rowFormats):
+        formatId = id(format)
+        if formatId not in formatKeys:
+            formatKeys[formatId] = (format, format_key(format))
+        key = formatKeys[formatId][1]
+        if len(runs) > 0 and runs[-1][2] == key:
+            runs[-1][1] = col + 1
+        else:
+            runs.append([col, col + 1, key, format])
+    return runs
+
+def _repeat_cell(sheetId, startRow, endRow, startCol, endCol, format):
+    return {
+        'repeatCell': {
+            'range': {'startRowIndex': startRow,
+                      'endRowIndex': endRow,
+                      'startColumnIndex': startCol,
+                      'endColumnIndex': endCol,
+                      'sheetId': sheetId
+                },
+            'cell': format,
+            'fields': 'userEnteredFormat',
+        }
+    }
+
+# formats: list of rows, each row is a list of formats of the cells starting at column 0
+# rowIndex: the index of the row in the sheet to which the first row of formats belongs
+# returns the list of repeatCell requests which apply the formats
+def compile_formats(sheetId, rowIndex, formats):
+    formatKeys = {}
+    rectangles = []
+    # (startCol, endCol, formatKey) -> [startRow, format] of the rectangles which can still grow down
+    openRectangles = {}
+    for rowOffset, rowFormats in enumerate(formats):
+        stillOpen = {}
+        for startCol, endCol, key, format in _runs(rowFormats, formatKeys):
+            run = (startCol, endCol, key)
+            stillOpen[run] = openRectangles.pop(run, [rowOffset, format])
+        for (startCol, endCol, key), (startRow, format) in openRectangles.items():
+            rectangles.append((startRow, rowOffset, startCol, endCol, format))
+        openRectangles = stillOpen
+    for (startCol, endCol, key), (startRow, format) in openRectangles.items():
+        rectangles.append((startRow, len(formats), startCol, endCol, format))
+
+    rectangles.sort(key=lambda rectangle: (rectangle[0], rectangle[2]))
+    return [_repeat_cell(sheetId, rowIndex + startRow, rowIndex + endRow, startCol, endCol, format) for startRow, endRow, startCol, endCol, format in rectangles]
@@ -1,3 +1,5 @@
+import json
+
 from common.constants import LABEL
 
 def boldFormat(bold):
@@ -18,4 +20,22 @@ def formatted_label_from_config(config):
     if labelFormat is None:
         return labelValue
     else:
-        return {'value': labelValue, 'format': labelFormat}
\ No newline at end of file
+        return {'value': labelValue, 'format': labelFormat}
+
+# the api returns both the deprecated and the new version of the colors, the deprecated ones need to be ignored
+# when comparing the format read from the sheet with the format which is about to be written
+DEPRECATED_FIELDS = {'backgroundColor': 'backgroundColorStyle', 'foregroundColor': 'foregroundColorStyle'}
+
+def _canonical(value):
+    if isinstance(value, dict):
+        return {key: _canonical(val) for key, val in value.items() if not (key in DEPRECATED_FIELDS and DEPRECATED_FIELDS[key] in value)}
+    if isinstance(value, list):
+        return [_canonical(val) for val in value]
+    if isinstance(value, float):
+        # the colors come back with slightly different precision than they have been written with
+        return round(value, 5)
+    return value
+
+# a hashable representation of a cell format which is the same for formats which look the same in the sheet
+def format_key(format):
+    return json.dumps(_canonical(format), sort_keys=True)
@@ -1,7 +1,13 @@
 # a file of various helper functions used by the plugins
 
+from array import array
+from itertools import chain
+
 from common.formatting import formatted_label_from_config
-from common.constants import SPLIT_BY
+from common.constants import SPLIT_BY, SORT, TREND
+from common.links import key_links
+from common.scheduler import parse_interval
+from common import history
 
 # gets the config and what key to look for in it. Expects to find either a comma separated list of strings in it or nothing.
 # If it finds nothing, it returns an empty list.
@@ -9,41 +15,134 @@ from common.constants import SPLIT_BY
 def split_array_from_config(config, key):
     return list(filter(lambda item: item, config.get(key, '').split(',')))
 
-def split_issues(config, issues, linkToAll, createIssueQuery, extractKey, extractVal, sortKeys = None):
-    if len(issues) == 0:
-        return []
+# the fields the result is split by, e.g. 'splitBy: status,priority' -> ['status', 'priority']
+def split_dimensions(config):
+    return [dimension.strip() for dimension in split_array_from_config(config, SPLIT_BY) if dimension.strip()]
 
-    label = formatted_label_from_config(config)
-    if SPLIT_BY not in config:
-        return [label, f'=HYPERLINK(\"{linkToAll}\", \"{len(issues)}\")']
-    
-    splitBy = config[SPLIT_BY]
-    values = [label, f'=HYPERLINK(\"{linkToAll}\", \"All: {len(issues)}\")']
+# the position of each value in the sort: param, the values which are not there go after them
+def sort_ranking(config):
+    return {item: rank for rank, item in enumerate(split_array_from_config(config, SORT))}
 
-    splitToCounts = {}
-    for issue in issues:
-        val = extractVal(issue, splitBy)
+# the list values (e.g. components) are shown joined
+def value_text(val):
+    strvals = []
+    for strval in val:
+        if isinstance(strval, str):
+            strvals.append(strval)
+        elif hasattr(strval, 'name'):
+            strvals.append(strval.name)
+        else:
+            strvals.append(str(strval))
+    return ", ".join(strvals)
+
+# the keys of one group, the numeric ones (e.g. bugzilla ids) are kept in an array instead of a list of ints
+def new_keys(key):
+    return array('q') if isinstance(key, int) else []
+
+# the keys of all the groups under the node of the tree built by split_issues
+def subtree_keys(node, depth):
+    if depth == 0:
+        return node
+    return list(chain.from_iterable(subtree_keys(child, depth - 1) for child in node.values()))
+
+# the cells of the groups under the node: each value, then (if the result is split by more dimensions) the groups
+# under it as 'value / subvalue: count'. The values are ordered by the ranking and then by when they were found first.
+# counts: filled by {'value / subvalue': count} of all the groups, for the history
+def group_cells(node, depth, prefix, ranking, createIssueUrls, counts):
+    unranked = len(ranking)
+    cells = []
+    for val in sorted(node, key=lambda val: ranking.get(val, unranked)):
+        text = f'{prefix}{val}'
+        keys = subtree_keys(node[val], depth - 1)
+        counts[text] = len(keys)
+        cells.extend(key_links(createIssueUrls(keys), text, len(keys)))
+        if depth > 1:
+            cells.extend(group_cells(node[val], depth - 1, f'{text} / ', ranking, createIssueUrls, counts))
+    return cells
+
+# the cell with the sparkline of the trend: of the number of issues, None if the config does not ask for it
+def trend_cell(config, numOfIssues):
+    seconds = parse_interval(config.get(TREND), None)
+    if seconds is None:
+        return None
+    return f'=SPARKLINE({{{",".join(str(count) for count in history.trend(config, seconds, numOfIssues))}}})'
+
+# adds the issue to the tree built by group_issues
+def add_issue(tree, dimensions, interned, issue, extractKey, extractVal):
+    node = tree
+    lastDimension = len(dimensions) - 1
+    for level, dimension in enumerate(dimensions):
+        val = extractVal(issue, dimension)
         if isinstance(val, list):
-            strvals = []
-            for strval in val:
-                if isinstance(strval, str):
-                    strvals.append(strval)
-                elif hasattr(strval, 'name'):
-                    strvals.append(strval.name)
-                else:
-                    strvals.append(str(strval))
-            val = ", ".join(strvals)
-        if val in splitToCounts:
-            splitToCounts[val].append(extractKey(issue))
+            val = value_text(val)
+        val = interned.setdefault(val, val)
+        if level < lastDimension:
+            node = node.setdefault(val, {})
         else:
-            splitToCounts[val] = [extractKey(issue)]
-    
-    sortedKeys = splitToCounts.keys()
-    if sortKeys is not None:
-        sortedKeys = sortKeys(splitToCounts.keys())
-
-    for splitToCount in sortedKeys:
-        queryUrl = createIssueQuery(splitToCounts[splitToCount])
-        values.append(f'=HYPERLINK(\"{queryUrl}\", \"{splitToCount}: {len(splitToCounts[splitToCount])}\")')
-    
-    return values
\ No newline at end of file
+            key = extractKey(issue)
+            keys = node.get(val)
+            if keys is None:
+                keys = node[val] = new_keys(key)
+            keys.append(key)
+
+# issues can be any iterable (e.g. a generator yielding the issues as they are loaded), it is iterated only once
+# extractVal(issue, dimension) returns the value of one of the dimensions of the issue
+# The issues are grouped by all the dimensions in one pass into a tree (value of the first dimension -> value of the
+# second one... -> keys), the values are interned so the same value found on many issues is stored only once.
+# Returns (the number of issues, the tree), which is all issue_cells needs, so it can be cached instead of the issues.
+def group_issues(dimensions, issues, extractKey, extractVal):
+    interned = {}
+    numOfIssues = 0
+    tree = {}
+    for issue in issues:
+        numOfIssues += 1
+        add_issue(tree, dimensions, interned, issue, extractKey, extractVal)
+    return (numOfIssues, tree)
+
+# Same as group_issues but for more configs sharing one fetched set of issues (e.g. the result of several queries
+# merged into one), each of them grouped by its split_dimensions. issues is iterated only once,
+# matches(config, issue) tells if the issue belongs to the config. Returns the groups in the order of the configs.
+def group_issues_many(configs, issues, matches, extractKey, extractVal):
+    dimensions = [split_dimensions(config) for config in configs]
+    interned = {}
+    numsOfIssues = [0] * len(configs)
+    trees = [{} for _ in configs]
+    for issue in issues:
+        for index, config in enumerate(configs):
+            if matches(config, issue):
+                numsOfIssues[index] += 1
+                add_issue(trees[index], dimensions[index], interned, issue, extractKey, extractVal)
+    return list(zip(numsOfIssues, trees))
+
+# The cells of the config showing the issues grouped by group_issues by the split_dimensions of the config.
+# createIssueUrls takes a list of issue keys and returns the list of urls listing them (more if they do not fit into one)
+# The counts are recorded into the history.
+def issue_cells(config, grouped, linkToAll, createIssueUrls):
+    dimensions = split_dimensions(config)
+    numOfIssues, tree = grouped
+    if len(dimensions) == 0:
+        history.record(config, {'': numOfIssues})
+        if numOfIssues == 0:
+            return []
+        values = [formatted_label_from_config(config), f'=HYPERLINK(\"{linkToAll}\", \"{numOfIssues}\")']
+        trend = trend_cell(config, numOfIssues)
+        if trend is not None:
+            values.append(trend)
+        return values
+
+    counts = {'': numOfIssues}
+    if numOfIssues == 0:
+        history.record(config, counts)
+        return []
+
+    values = [formatted_label_from_config(config), f'=HYPERLINK(\"{linkToAll}\", \"All: {numOfIssues}\")']
+    trend = trend_cell(config, numOfIssues)
+    if trend is not None:
+        values.append(trend)
+    values.extend(group_cells(tree, len(dimensions), '', sort_ranking(config), createIssueUrls, counts))
+    history.record(config, counts)
+    return values
+
+# groups the issues (any iterable, iterated only once) by the split_dimensions of the config and returns its cells
+def split_issues(config, issues, linkToAll, createIssueUrls, extractKey, extractVal):
+    return issue_cells(config, group_issues(split_dimensions(config), issues, extractKey, extractVal), linkToAll, createIssueUrls)
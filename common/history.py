@@ -0,0 +1,218 @@
+# A local history of the counts printed by the filters, so that their trends can be shown without asking the backends
+# about the past. Each cycle appends a (timestamp, count) sample of each filter and each of its splits (a series)
+# to the end of the file as fixed size binary records; in memory each series is kept as two arrays, one of the
+# timestamps and one of the counts.
+# The file is compacted once enough samples can be dropped: the older samples are downsampled to one per hour / day
+# (the last one of it) and the oldest ones are dropped, so the file does not grow without limit. This is checked when
+# the history is loaded (so also by the runs executing just one cycle) and after the appends of a long running daemon.
+
+import logging
+import os
+import struct
+import threading
+import time
+from array import array
+from bisect import bisect_left
+
+from common.constants import ID, TAB, LABEL
+from common.files import app_path, write_atomically
+
+DEFAULT_PATH = app_path('history.bin')
+
+HOUR = 60 * 60
+DAY = 24 * HOUR
+# (minimal age, resolution) of the samples, from the oldest; the newer ones are kept as they are
+RETENTION = [(90 * DAY, DAY), (2 * DAY, HOUR)]
+# the samples older than this are dropped
+MAX_AGE = 400 * DAY
+# the file is compacted once this many samples can be dropped by the downsampling (or, in a long running process,
+# have been appended since it has been loaded)
+COMPACT_EVERY = 50000
+# how many points a trend has at most
+TREND_POINTS = 30
+
+# the records of the file: a new series (followed by its name in utf-8, it gets the next index) and a sample of a series
+SERIES_RECORD = 0
+SAMPLE_RECORD = 1
+_TYPE = struct.Struct('<B')
+# type, length of the name
+_SERIES = struct.Struct('<BH')
+# type, index of the series, timestamp, count
+_SAMPLE = struct.Struct('<BIdq')
+
+_lock = threading.Lock()
+# names: the series in the order of their index, index: name -> index, times/counts: the arrays of each series,
+# pending: (name, timestamp, count) recorded in this cycle and not written yet,
+# appended: the samples which can be dropped by the downsampling of the loaded file + the samples appended since
+_state = {'path': DEFAULT_PATH, 'loaded': False, 'names': [], 'index': {}, 'times': [], 'counts': [], 'pending': [], 'appended': 0}
+
+def configure(path=DEFAULT_PATH):
+    with _lock:
+        _state.update(path=path, loaded=False, names=[], index={}, times=[], counts=[], pending=[], appended=0)
+
+# the series of the filter (identified by its id: or by its tab: and label:) and one of its splits ('' is all the issues)
+def series_name(config, split=''):
+    filterName = config[ID] if ID in config else f'{config.get(TAB, "")} / {config.get(LABEL, "")}'
+    return f'{filterName}\t{split}'
+
+def _add_series(name):
+    _state['index'][name] = len(_state['names'])
+    _state['names'].append(name)
+    _state['times'].append(array('d'))
+    _state['counts'].append(array('q'))
+
+# Reads the records into the state, stops at the first incomplete or invalid one. Returns where it has stopped.
+def _parse(content):
+    offset = 0
+    while offset < len(content):
+        recordType = _TYPE.unpack_from(content, offset)[0]
+        if recordType == SERIES_RECORD:
+            if offset + _SERIES.size > len(content):
+                break
+            length = _SERIES.unpack_from(content, offset)[1]
+            if offset + _SERIES.size + length > len(content):
+                break
+            try:
+                name = content[offset + _SERIES.size:offset + _SERIES.size + length].decode()
+            except UnicodeDecodeError:
+                break
+            if name in _state['index']:
+                break
+            _add_series(name)
+            offset += _SERIES.size + length
+        elif recordType == SAMPLE_RECORD:
+            if offset + _SAMPLE.size > len(content):
+                break
+            _, seriesIndex, timestamp, count = _SAMPLE.unpack_from(content, offset)
+            if seriesIndex >= len(_state['names']):
+                break
+            _state['times'][seriesIndex].append(timestamp)
+            _state['counts'][seriesIndex].append(count)
+            offset += _SAMPLE.size
+        else:
+            break
+    return offset
+
+def _load():
+    if _state['loaded']:
+        return
+    _state['loaded'] = True
+    if not os.path.exists(_state['path']):
+        return
+    with open(_state['path'], 'rb') as file:
+        content = file.read()
+    valid = _parse(content)
+    if valid < len(content):
+        # e.g. the last append has been interrupted, the next ones need to start at the end of the last whole record
+        logging.warning(f'Dropping {len(content) - valid} bytes of an incomplete or invalid record at the end of the history {_state["path"]}')
+        with open(_state['path'], 'r+b') as file:
+            file.truncate(valid)
+
+    now = time.time()
+    loaded = sum(len(times) for times in _state['times'])
+    kept = sum(len(_downsample(times, counts, now)[0]) for times, counts in zip(_state['times'], _state['counts']))
+    _state['appended'] = loaded - kept
+    if _state['appended'] >= COMPACT_EVERY:
+        _compact(now)
+
+def _series_record(name):
+    encoded = name.encode()
+    return _SERIES.pack(SERIES_RECORD, len(encoded)) + encoded
+
+# remembers the counts of the filter in this cycle, counts: {split: count} with '' as all the issues.
+# They are written by flush().
+def record(config, counts, now=None):
+    now = now if now is not None else time.time()
+    with _lock:
+        _state['pending'].extend((series_name(config, split), now, count) for split, count in counts.items())
+
+# appends the samples recorded in this cycle to the history
+def flush():
+    with _lock:
+        _load()
+        if len(_state['pending']) == 0:
+            return
+        content = bytearray()
+        for name, timestamp, count in _state['pending']:
+            if name not in _state['index']:
+                _add_series(name)
+                content += _series_record(name)
+            seriesIndex = _state['index'][name]
+            _state['times'][seriesIndex].append(timestamp)
+            _state['counts'][seriesIndex].append(count)
+            content += _SAMPLE.pack(SAMPLE_RECORD, seriesIndex, timestamp, count)
+        _state['appended'] += len(_state['pending'])
+        _state['pending'] = []
+        with open(_state['path'], 'ab') as file:
+            file.write(content)
+        if _state['appended'] >= COMPACT_EVERY:
+            _compact(time.time())
+
+# the bucket of the sample after the downsampling, None if it is kept as it is
+def _bucket(timestamp, now):
+    age = now - timestamp
+    for minAge, resolution in RETENTION:
+        if age >= minAge:
+            return (resolution, timestamp // resolution)
+    return None
+
+def _downsample(times, counts, now):
+    newTimes = array('d')
+    newCounts = array('q')
+    lastBucket = None
+    for timestamp, count in zip(times, counts):
+        if now - timestamp >= MAX_AGE:
+            continue
+        bucket = _bucket(timestamp, now)
+        if bucket is not None and bucket == lastBucket:
+            # the last sample of the bucket wins
+            newTimes[-1] = timestamp
+            newCounts[-1] = count
+        else:
+            newTimes.append(timestamp)
+            newCounts.append(count)
+        lastBucket = bucket
+    return (newTimes, newCounts)
+
+# downsamples all the series and writes the whole history again, the series without samples are dropped
+def _compact(now):
+    names = _state['names']
+    downsampled = [_downsample(times, counts, now) for times, counts in zip(_state['times'], _state['counts'])]
+    _state.update(names=[], index={}, times=[], counts=[], appended=0)
+    content = bytearray()
+    for name, (times, counts) in zip(names, downsampled):
+        if len(times) == 0:
+            continue
+        seriesIndex = len(_state['names'])
+        _add_series(name)
+        _state['times'][seriesIndex] = times
+        _state['counts'][seriesIndex] = counts
+        content += _series_record(name)
+        for timestamp, count in zip(times, counts):
+            content += _SAMPLE.pack(SAMPLE_RECORD, seriesIndex, timestamp, count)
+    write_atomically(_state['path'], content, 'wb')
+    logging.info(f'History compacted to {len(content)} bytes ({len(_state["names"])} series)')
+
+# The counts of the series over the last `seconds` split into at most TREND_POINTS equal periods, each represented by
+# the last count in it (the periods without any sample are skipped). The current count (not stored yet) is the last.
+def trend(config, seconds, current, split='', now=None):
+    now = now if now is not None else time.time()
+    since = now - seconds
+    points = []
+    with _lock:
+        _load()
+        seriesIndex = _state['index'].get(series_name(config, split))
+        if seriesIndex is not None:
+            times = _state['times'][seriesIndex]
+            counts = _state['counts'][seriesIndex]
+            period = seconds / TREND_POINTS
+            lastPeriod = None
+            for position in range(bisect_left(times, since), len(times)):
+                periodIndex = int((times[position] - since) // period)
+                if periodIndex == lastPeriod:
+                    points[-1] = counts[position]
+                else:
+                    points.append(counts[position])
+                lastPeriod = periodIndex
+    points.append(current)
+    return points[-TREND_POINTS:]
@@ -0,0 +1,47 @@
+# Builds the =HYPERLINK formulas pointing to lists of issues.
+# The issues are put into the url as a plain list of keys and the number of them is written into the text of the link
+# directly, so the size of the formula grows only with the keys themselves. If the url would be too long for the
+# browser/server (or the cell), the keys are split into more links, each in its own cell.
+
+# the servers (and some browsers) refuse longer urls
+MAX_URL_LENGTH = 8000
+
+# the text of a formula is in double quotes, the quotes inside of it need to be doubled
+def escape_formula_string(text):
+    return str(text).replace('"', '""')
+
+def hyperlink(url, text):
+    return f'=HYPERLINK("{url}", "{escape_formula_string(text)}")'
+
+# Splits the keys into chunks so that prefix + keys joined by the separator + suffix is at most maxLength long.
+# A single key longer than the limit still gets its own chunk.
+def chunk_keys(keys, prefix, separator, suffix='', maxLength=MAX_URL_LENGTH):
+    chunks = []
+    chunk = []
+    fixedLength = len(prefix) + len(suffix)
+    length = fixedLength
+    for key in keys:
+        key = str(key)
+        added = len(key) + (len(separator) if len(chunk) > 0 else 0)
+        if len(chunk) > 0 and length + added > maxLength:
+            chunks.append(chunk)
+            chunk = []
+            length = fixedLength
+            added = len(key)
+        chunk.append(key)
+        length += added
+
+    if len(chunk) > 0:
+        chunks.append(chunk)
+    return chunks
+
+# returns a function taking the keys and returning the list of urls listing them, e.g.
+# key_list_urls('https://host/search?ids=', ',') for ['A', 'B'] returns ['https://host/search?ids=A,B']
+def key_list_urls(prefix, separator, suffix='', maxLength=MAX_URL_LENGTH):
+    return lambda keys: [f'{prefix}{separator.join(chunk)}{suffix}' for chunk in chunk_keys(keys, prefix, separator, suffix, maxLength)]
+
+# the cells with the links to the issues: 'text: count' or, if they had to be split, 'text: count (1/2)', 'text: count (2/2)'...
+def key_links(urls, text, count):
+    if len(urls) == 1:
+        return [hyperlink(urls[0], f'{text}: {count}')]
+    return [hyperlink(url, f'{text}: {count} ({i}/{len(urls)})') for i, url in enumerate(urls, 1)]
@@ -0,0 +1,115 @@
+# Collects the metrics of the app (how long the filters and the api calls take, how much is sent/received,
+# how much is written to the tabs...) and exports them after each cycle either as a Prometheus text file
+# (e.g. for the node exporter textfile collector) or, if the file ends with .json, as a JSON snapshot.
+# The counters and histograms are cumulative for the whole life of the process, as Prometheus expects.
+
+import json
+import math
+import threading
+import time
+
+from common.files import write_atomically
+
+# the upper bounds (in seconds) of the buckets of the latency histograms
+BUCKETS = (0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30, 60, 120, math.inf)
+PREFIX = 'siall_'
+
+_lock = threading.Lock()
+# (name, labels) -> value
+_counters = {}
+_gauges = {}
+# (name, labels) -> {'buckets': [count per bucket], 'sum': float, 'count': int}
+_histograms = {}
+
+def _key(name, labels):
+    return (name, tuple(sorted((labels or {}).items())))
+
+def inc(name, labels=None, amount=1):
+    key = _key(name, labels)
+    with _lock:
+        _counters[key] = _counters.get(key, 0) + amount
+
+def set_gauge(name, labels=None, value=0):
+    with _lock:
+        _gauges[_key(name, labels)] = value
+
+def observe(name, labels=None, value=0):
+    key = _key(name, labels)
+    with _lock:
+        histogram = _histograms.get(key)
+        if histogram is None:
+            histogram = {'buckets': [0] * len(BUCKETS), 'sum': 0.0, 'count': 0}
+            _histograms[key] = histogram
+        for i, bound in enumerate(BUCKETS):
+            if value <= bound:
+                histogram['buckets'][i] += 1
+                break
+        histogram['sum'] += value
+        histogram['count'] += 1
+
+# returns {labels as a tuple of (name, value): value} of the counter with the given name
+def get_counter(name):
+    with _lock:
+        return {labels: value for (metricName, labels), value in _counters.items() if metricName == name}
+
+def reset():
+    with _lock:
+        _counters.clear()
+        _gauges.clear()
+        _histograms.clear()
+
+def _escape_label(value):
+    return str(value).replace('\\', '\\\\').replace('\n', '\\n').replace('"', '\\"')
+
+def _labels_text(labels, extra=()):
+    items = list(labels) + list(extra)
+    if len(items) == 0:
+        return ''
+    return '{' + ','.join(f'{name}="{_escape_label(value)}"' for name, value in items) + '}'
+
+def _bound_text(bound):
+    return '+Inf' if bound == math.inf else repr(float(bound))
+
+def to_prometheus():
+    lines = []
+    with _lock:
+        for kind, values in (('counter', _counters), ('gauge', _gauges)):
+            for name in sorted({name for name, _ in values}):
+                lines.append(f'# TYPE {PREFIX}{name} {kind}')
+                for (metricName, labels), value in sorted(values.items()):
+                    if metricName == name:
+                        lines.append(f'{PREFIX}{name}{_labels_text(labels)} {value}')
+
+        for name in sorted({name for name, _ in _histograms}):
+            lines.append(f'# TYPE {PREFIX}{name} histogram')
+            for (metricName, labels), histogram in sorted(_histograms.items()):
+                if metricName != name:
+                    continue
+                cumulative = 0
+                for bound, count in zip(BUCKETS, histogram['buckets']):
+                    cumulative += count
+                    lines.append(f'{PREFIX}{name}_bucket{_labels_text(labels, [("le", _bound_text(bound))])} {cumulative}')
+                lines.append(f'{PREFIX}{name}_sum{_labels_text(labels)} {histogram["sum"]}')
+                lines.append(f'{PREFIX}{name}_count{_labels_text(labels)} {histogram["count"]}')
+
+    return '\n'.join(lines) + '\n'
+
+def to_json():
+    def entries(values, toValue):
+        return [{'name': name, 'labels': dict(labels), **toValue(value)} for (name, labels), value in sorted(values.items())]
+
+    with _lock:
+        snapshot = {
+            'timestamp': time.time(),
+            'counters': entries(_counters, lambda value: {'value': value}),
+            'gauges': entries(_gauges, lambda value: {'value': value}),
+            'histograms': entries(_histograms, lambda histogram: {
+                'buckets': {_bound_text(bound): count for bound, count in zip(BUCKETS, histogram['buckets'])},
+                'sum': histogram['sum'],
+                'count': histogram['count']})
+        }
+    return json.dumps(snapshot, indent=2)
+
+# writes the metrics into the file, the format is given by its extension
+def export(path):
+    write_atomically(path, to_json() if path.endswith('.json') else to_prometheus())
@@ -0,0 +1,71 @@
+import getopt
+import logging
+import sys
+
+# all the command line options understood by the app. They are parsed here once so that the different parts
+# of the app (e.g. the plugins) do not fail on options which belong to someone else
+LONG_OPTIONS = [
+    # the token used to login to jira
+    'jiratoken=',
+    # keep running and execute each filter according to its interval: instead of executing all of them once and exiting
+    'daemon',
+    # max number of filters executed at the same time
+    'workers=',
+    # max number of filters executed at the same time per plugin, e.g. --plugin-workers bz-filter:4,jira-filter:2
+    'plugin-workers=',
+    # for how many seconds the results of the queries are reused also in the next cycles
+    'query-cache-ttl=',
+    # max number of query results kept in the cache
+    'query-cache-size=',
+    # the sqlite file in which the state of the stateful filters is kept (state.sqlite next to main.py by default)
+    'state-file=',
+    # the file the local copy of the content of the spreadsheet is kept in (snapshot.bin next to main.py by default)
+    'snapshot-file=',
+    # the file the history of the counts printed by the filters is kept in, for the trend: param (history.bin next to main.py by default)
+    'history-file=',
+    # the file the metrics are written to after each cycle, in the Prometheus text format or as JSON if it ends with .json
+    'metrics-file=',
+    # max number of calls per second per service, e.g. --rate-limits sheets:0.5,jira:5
+    'rate-limits=',
+    # the file the timeline of each cycle is written to, in the Chrome trace event format (chrome://tracing, perfetto)
+    'trace-file=',
+    # sample the stacks of all the threads during each cycle and write them to profile.folded next to main.py (for a flame graph)
+    'profile',
+]
+
+_options = None
+
+def get_options():
+    global _options
+    if _options is None:
+        try:
+            opts, args = getopt.getopt(sys.argv[1:], '', LONG_OPTIONS)
+        except getopt.GetoptError as e:
+            logging.error(f'Invalid command line options: {e}. Supported options: {", ".join("--" + o.rstrip("=") for o in LONG_OPTIONS)}')
+            sys.exit(2)
+        _options = dict(opts)
+
+    return _options
+
+# returns the value of the option with the given name (without the leading --) or the default if not provided
+def get_option(name, default=None):
+    return get_options().get(f'--{name}', default)
+
+# options without value (e.g. --daemon) are either present or not
+def get_flag(name):
+    return get_option(name) is not None
+
+def get_int_option(name, default):
+    value = get_option(name)
+    if value is None:
+        return default
+    return int(value)
+
+# parses options in the format key1:value1,key2:value2 into a dict
+def get_dict_option(name):
+    res = {}
+    for item in filter(lambda item: item, get_option(name, '').split(',')):
+        key, _, value = item.rpartition(':')
+        res[key.strip()] = value.strip()
+
+    return res
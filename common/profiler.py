@@ -0,0 +1,72 @@
+# A sampling profiler of all the threads of the app (the filters run on the worker threads, which cProfile would not
+# see). While it runs, a background thread takes the stack of each thread every INTERVAL seconds; the stacks are
+# counted in the folded format ('thread;outer function;...;inner function count' per line) which can be turned into
+# a flame graph by e.g. flamegraph.pl or https://www.speedscope.app.
+
+import logging
+import os
+import sys
+import threading
+
+from common.files import app_path, write_atomically
+
+DEFAULT_PATH = app_path('profile.folded')
+# how often the stacks are sampled
+INTERVAL = 0.005
+
+_lock = threading.Lock()
+# stacks: folded stack -> number of samples, sampler: the sampling thread while running
+_state = {'stacks': {}, 'samples': 0, 'sampler': None, 'stop': None}
+
+def _frame_name(frame):
+    code = frame.f_code
+    return f'{code.co_name} ({os.path.basename(code.co_filename)}:{code.co_firstlineno})'
+
+def _sample(ownIdent, threadNames):
+    for ident, frame in sys._current_frames().items():
+        if ident == ownIdent:
+            continue
+        names = []
+        while frame is not None:
+            names.append(_frame_name(frame))
+            frame = frame.f_back
+        # threads of the thread pools come and go, they are shown by their name without the number
+        threadName = threadNames.get(ident, str(ident)).rstrip('0123456789_-')
+        stack = ';'.join([threadName] + names[::-1])
+        with _lock:
+            _state['stacks'][stack] = _state['stacks'].get(stack, 0) + 1
+            _state['samples'] += 1
+
+def _run(stop):
+    ownIdent = threading.get_ident()
+    while not stop.wait(INTERVAL):
+        _sample(ownIdent, {thread.ident: thread.name for thread in threading.enumerate()})
+
+# starts sampling, the samples of the previous run are dropped
+def start():
+    with _lock:
+        if _state['sampler'] is not None:
+            return
+        _state['stacks'] = {}
+        _state['samples'] = 0
+        _state['stop'] = threading.Event()
+        _state['sampler'] = threading.Thread(target=_run, args=(_state['stop'],), name='profiler', daemon=True)
+        _state['sampler'].start()
+
+def stop():
+    with _lock:
+        sampler = _state['sampler']
+        _state['sampler'] = None
+        if sampler is None:
+            return
+        _state['stop'].set()
+    sampler.join()
+
+# the folded stacks sampled by the last run, the most frequent first
+def folded():
+    with _lock:
+        return ''.join(f'{stack} {count}\n' for stack, count in sorted(_state['stacks'].items(), key=lambda item: -item[1]))
+
+def write(path=DEFAULT_PATH):
+    write_atomically(path, folded())
+    logging.info(f'Profile of {_state["samples"]} samples written to {path}')
@@ -0,0 +1,114 @@
+# A cache of the results of the queries sent to the backends (bugzilla, jira, gmail...).
+# Many rows of the config contain the same query and differ only in how the result is presented (splitBy:, label:, tab:),
+# so during one cycle each query is sent only once and all the rows share the result. If the same query is requested
+# while it is still being loaded, the caller waits for that load instead of sending it again.
+# With a ttl, the results are kept also across cycles which is useful for filters which change slowly.
+
+import logging
+import threading
+import time
+from collections import OrderedDict
+from concurrent.futures import Future
+
+# by default the results are shared only inside of one cycle
+DEFAULT_TTL = 0
+DEFAULT_MAX_ENTRIES = 256
+
+_lock = threading.Lock()
+# key -> (cycle in which it has been loaded, time when it has been loaded, result)
+_entries = OrderedDict()
+# key -> Future of the result which is being loaded
+_loading = {}
+_settings = {'ttl': DEFAULT_TTL, 'maxEntries': DEFAULT_MAX_ENTRIES}
+_state = {'cycle': 0, 'hits': 0, 'misses': 0}
+
+# ttl: for how many seconds a result can be used also in the next cycles (0 means only in the cycle it has been loaded in)
+# maxEntries: how many results are kept at most, the least recently used ones are dropped first
+def configure(ttl=DEFAULT_TTL, maxEntries=DEFAULT_MAX_ENTRIES):
+    with _lock:
+        _settings['ttl'] = ttl
+        _settings['maxEntries'] = maxEntries
+
+def start_cycle():
+    with _lock:
+        _state['cycle'] += 1
+        _state['hits'] = 0
+        _state['misses'] = 0
+        # drop what can not be used anymore so it does not occupy memory until evicted
+        for key in [key for key, entry in _entries.items() if not _is_valid(entry)]:
+            del _entries[key]
+
+def log_stats():
+    with _lock:
+        logging.info(f'Query cache: {_state["hits"]} hits, {_state["misses"]} misses, {len(_entries)} cached results')
+
+def normalize_query(query):
+    return ' '.join(query.split())
+
+def _is_valid(entry):
+    cycle, loadedAt, _ = entry
+    return cycle == _state['cycle'] or time.time() - loadedAt < _settings['ttl']
+
+# Returns the result of the query, calling the loader only if the result is not cached yet.
+# plugin: the name of the plugin the query belongs to
+# query: the query (anything hashable), normalized so that the same queries written differently are the same
+# fields: the fields loaded for each result
+# loader: function with no args loading the result. The result is shared by all the callers so it must not be modified.
+def fetch(plugin, query, fields, loader):
+    return fetch_many(plugin, [query], fields, lambda queries: {query: loader()})[0]
+
+# Same as fetch() but for more queries at once, for backends which can load more queries by one request.
+# loader: function taking the list of the queries which are not cached yet and returning a dict of query -> result
+# Returns the list of results in the order of the queries.
+def fetch_many(plugin, queries, fields, loader):
+    fields = tuple(sorted(fields))
+    results = {}
+    waitFor = {}
+    toLoad = {}
+    with _lock:
+        loadingCycle = _state['cycle']
+        for query in queries:
+            key = (plugin, query, fields)
+            if query in results or query in waitFor or query in toLoad:
+                continue
+            entry = _entries.get(key)
+            if entry is not None and _is_valid(entry):
+                _entries.move_to_end(key)
+                _state['hits'] += 1
+                results[query] = entry[2]
+            elif key in _loading:
+                # the same query is being loaded right now, wait for it
+                _state['hits'] += 1
+                waitFor[query] = _loading[key]
+            else:
+                _state['misses'] += 1
+                toLoad[query] = Future()
+                _loading[key] = toLoad[query]
+
+    if len(toLoad) > 0:
+        try:
+            loaded = loader(list(toLoad))
+        except Exception as e:
+            with _lock:
+                for query in toLoad:
+                    del _loading[(plugin, query, fields)]
+            for future in toLoad.values():
+                future.set_exception(e)
+            raise
+
+        with _lock:
+            for query in toLoad:
+                key = (plugin, query, fields)
+                del _loading[key]
+                _entries[key] = (loadingCycle, time.time(), loaded[query])
+                _entries.move_to_end(key)
+            while len(_entries) > _settings['maxEntries']:
+                _entries.popitem(last=False)
+        for query, future in toLoad.items():
+            future.set_result(loaded[query])
+            results[query] = loaded[query]
+
+    for query, future in waitFor.items():
+        results[query] = future.result()
+
+    return [results[query] for query in queries]
@@ -0,0 +1,81 @@
+# Keeps the calls to each service (sheets, gmail, jira, bugzilla) within its rate limit, shared by all the threads.
+# Each service has a token bucket: it allows a burst of calls and than refills by the given rate (calls per second).
+# If more callers wait for the same service, the writes go first so that a tab being written is not starved by reads.
+# When the service tells us to slow down (429 with Retry-After), the whole service is blocked for that time.
+
+import heapq
+import itertools
+import threading
+import time
+
+PRIORITY_WRITE = 0
+PRIORITY_READ = 1
+
+# service -> (calls per second, burst)
+# sheets allows 60 write and 60 read requests per minute per user, gmail 250 quota units per second per user
+# (a list costs 5 units)
+DEFAULT_RATES = {'sheets': (1.0, 10), 'gmail': (40.0, 50), 'jira': (10.0, 20), 'bugzilla': (10.0, 20)}
+# for services not listed above
+DEFAULT_RATE = (10.0, 20)
+
+_condition = threading.Condition()
+_rates = dict(DEFAULT_RATES)
+# service -> {'rate', 'burst', 'tokens', 'updated', 'blockedUntil', 'waiting': heap of (priority, sequence)}
+_buckets = {}
+_sequence = itertools.count()
+
+# rates: service -> calls per second, e.g. {'sheets': '0.5'}. The services not listed keep their default.
+# Raises ValueError if some rate is not a positive number.
+def configure(rates):
+    parsed = {service: float(rate) for service, rate in rates.items()}
+    for service, rate in parsed.items():
+        if not rate > 0:
+            raise ValueError(f'The rate limit of {service} needs to be positive, got {rate}')
+    with _condition:
+        for service, rate in parsed.items():
+            _rates[service] = (rate, _rates.get(service, DEFAULT_RATE)[1])
+        _buckets.clear()
+
+def _bucket(service):
+    if service not in _buckets:
+        rate, burst = _rates.get(service, DEFAULT_RATE)
+        _buckets[service] = {'rate': rate, 'burst': burst, 'tokens': burst, 'updated': time.monotonic(), 'blockedUntil': 0, 'waiting': []}
+    return _buckets[service]
+
+def _refill(bucket, now):
+    bucket['tokens'] = min(bucket['burst'], bucket['tokens'] + (now - bucket['updated']) * bucket['rate'])
+    bucket['updated'] = now
+
+# Waits until the service can be called. tokens: how many calls are about to be done (e.g. a batch of requests).
+# Returns for how many seconds the caller has waited.
+def acquire(service, tokens=1, priority=PRIORITY_READ):
+    start = time.monotonic()
+    with _condition:
+        bucket = _bucket(service)
+        # a batch bigger than the burst would never fit, it gets the whole bucket instead
+        tokens = min(tokens, bucket['burst'])
+        entry = (priority, next(_sequence))
+        heapq.heappush(bucket['waiting'], entry)
+        try:
+            while True:
+                now = time.monotonic()
+                _refill(bucket, now)
+                if bucket['waiting'][0] != entry:
+                    # someone with a higher priority or earlier is first, wait until it is done
+                    _condition.wait()
+                    continue
+                if now >= bucket['blockedUntil'] and bucket['tokens'] >= tokens:
+                    bucket['tokens'] -= tokens
+                    return now - start
+                _condition.wait(max(bucket['blockedUntil'] - now, (tokens - bucket['tokens']) / bucket['rate']))
+        finally:
+            bucket['waiting'].remove(entry)
+            heapq.heapify(bucket['waiting'])
+            _condition.notify_all()
+
+# nobody calls the service for the given number of seconds (e.g. it has answered by 429 with Retry-After)
+def block(service, seconds):
+    with _condition:
+        bucket = _bucket(service)
+        bucket['blockedUntil'] = max(bucket['blockedUntil'], time.monotonic() + seconds)
+        _condition.notify_all()
@@ -0,0 +1,69 @@
+# Decides which filters need to be executed in the current cycle when running as a daemon.
+# Each filter runs according to its own interval (the interval: param, DEFAULT_INTERVAL if not set). The next run is
+# shifted by a random jitter so that the filters added at the same time do not keep running at the same time, and
+# if the result of a filter has not changed for several runs in a row, it is executed less and less often
+# (up to MAX_BACKOFF times its interval) until it changes again.
+# The last result of each filter is remembered so that the filters which are not executed in a cycle can still
+# be printed.
+
+import random
+import re
+import time
+
+DEFAULT_INTERVAL = 10 * 60
+# after how many runs with the same result the interval starts to grow
+UNCHANGED_RUNS_BEFORE_BACKOFF = 3
+MAX_BACKOFF = 8
+# the next run is planned randomly up to this fraction of the interval earlier or later
+JITTER = 0.1
+
+_UNITS = {'': 1, 's': 1, 'm': 60, 'h': 60 * 60, 'd': 24 * 60 * 60}
+
+# filter key -> {'nextRun': timestamp, 'unchangedRuns': int, 'result': the last result}
+_filters = {}
+
+# parses the interval, e.g. 90, 90s, 5m, 1h or 1d into seconds. Returns the default if it is not set or invalid.
+def parse_interval(value, default=DEFAULT_INTERVAL):
+    mo = re.fullmatch(r'\s*(\d+(?:\.\d+)?)\s*([smhd]?)\s*', value or '')
+    if not mo:
+        return default
+    return float(mo.group(1)) * _UNITS[mo.group(2)]
+
+def is_due(key, now=None):
+    if key not in _filters:
+        return True
+    return _filters[key]['nextRun'] <= (now if now is not None else time.time())
+
+def last_result(key):
+    return _filters[key]['result']
+
+# remembers the result of the filter which has just been executed and plans its next run
+def record_run(key, interval, result, now=None):
+    now = now if now is not None else time.time()
+    state = _filters.get(key)
+    if state is not None and state['result'] == result:
+        unchangedRuns = state['unchangedRuns'] + 1
+    else:
+        unchangedRuns = 0
+
+    backoff = 1
+    if unchangedRuns >= UNCHANGED_RUNS_BEFORE_BACKOFF:
+        backoff = min(2 ** (unchangedRuns - UNCHANGED_RUNS_BEFORE_BACKOFF + 1), MAX_BACKOFF)
+
+    _filters[key] = {
+        'nextRun': now + interval * backoff * (1 + random.uniform(-JITTER, JITTER)),
+        'unchangedRuns': unchangedRuns,
+        'result': result
+    }
+
+# forgets the filters which are not in the config anymore
+def retain(keys):
+    for key in [key for key in _filters if key not in keys]:
+        del _filters[key]
+
+# how long to wait until some of the filters is due
+def seconds_until_next_run(now=None):
+    now = now if now is not None else time.time()
+    if len(_filters) == 0:
+        return 0
+    return max(0, min(state['nextRun'] for state in _filters.values()) - now)
@@ -0,0 +1,81 @@
+# Compares the current content of a tab with the content which should be written to it and creates the requests
+# for the spreadsheets.batchUpdate call which change only the rows which differ.
+# The rows are matched by their values and formats, so if a section in the middle of the tab grows or shrinks,
+# only the rows of that section are inserted/deleted/rewritten and the rest of the tab is not touched.
+
+from difflib import SequenceMatcher
+
+from common.formatting import format_key
+from common.formatcompiler import compile_formats
+
+def _row_keys(data, formats):
+    formatKeys = {}
+    res = []
+    for values, rowFormats in zip(data, formats):
+        keys = []
+        for format in rowFormats:
+            # most of the cells share a couple of formats, no need to serialize them again and again
+            formatId = id(format)
+            if formatId not in formatKeys:
+                formatKeys[formatId] = (format, format_key(format))
+            keys.append(formatKeys[formatId][1])
+        res.append((tuple(values), tuple(keys)))
+    return res
+
+def to_cell_value(value):
+    if isinstance(value, bool):
+        return {'userEnteredValue': {'boolValue': value}}
+    if isinstance(value, (int, float)):
+        return {'userEnteredValue': {'numberValue': value}}
+    if value is None or value == '':
+        return {}
+    if value.startswith('='):
+        return {'userEnteredValue': {'formulaValue': value}}
+    return {'userEnteredValue': {'stringValue': value}}
+
+def _rows_range(sheetId, startIndex, endIndex):
+    return {'sheetId': sheetId, 'dimension': 'ROWS', 'startIndex': startIndex, 'endIndex': endIndex}
+
+def _write_rows(requests, sheetId, rowIndex, values, formats):
+    # clear whatever has been in the rows before, including the cells right of the new values
+    requests.append({
+        'updateCells': {
+            'range': {'sheetId': sheetId, 'startRowIndex': rowIndex, 'endRowIndex': rowIndex + len(values)},
+            'fields': 'userEnteredValue,userEnteredFormat'
+        }
+    })
+    requests.append({
+        'updateCells': {
+            'start': {'sheetId': sheetId, 'rowIndex': rowIndex, 'columnIndex': 0},
+            'rows': [{'values': [to_cell_value(value) for value in row]} for row in values],
+            'fields': 'userEnteredValue'
+        }
+    })
+    requests.extend(compile_formats(sheetId, rowIndex, formats))
+
+# Returns the list of requests for spreadsheets.batchUpdate which turn the old rows into the new ones.
+# Returns an empty list if there is nothing to change.
+# oldData/newValues: list of rows, each row is a list of values
+# oldFormats/newFormats: list of rows, each row is a list of formats (e.g. {'userEnteredFormat': {...}}) of the cells
+def diff_requests(sheetId, oldData, oldFormats, newValues, newFormats):
+    matcher = SequenceMatcher(None, _row_keys(oldData, oldFormats), _row_keys(newValues, newFormats), autojunk=False)
+
+    requests = []
+    # going from the bottom so the row indexes of the changes which are still to be done are not shifted
+    # by the inserts and deletes done before them (the batchUpdate applies the requests in order)
+    for tag, oldStart, oldEnd, newStart, newEnd in reversed(matcher.get_opcodes()):
+        if tag == 'equal':
+            continue
+
+        numOfOld = oldEnd - oldStart
+        numOfNew = newEnd - newStart
+        if numOfOld > numOfNew:
+            requests.append({'deleteDimension': {'range': _rows_range(sheetId, oldStart + numOfNew, oldEnd)}})
+        elif numOfNew > numOfOld:
+            requests.append({'insertDimension': {'range': _rows_range(sheetId, oldEnd, oldStart + numOfNew), 'inheritFromBefore': False}})
+
+        # the rows which exist in both are rewritten in place, the surplus ones have just been deleted/inserted
+        if numOfNew > 0:
+            _write_rows(requests, sheetId, oldStart, newValues[newStart:newEnd], newFormats[newStart:newEnd])
+
+    return requests
@@ -0,0 +1,106 @@
+# A local copy of the content of the spreadsheet (the data and formats of all the tabs as produced by
+# normalize_data_and_format) so that it does not need to be downloaded every cycle if nobody has changed it.
+# Whether it has changed is told by the modifiedTime of the spreadsheet in google drive, which is way cheaper to get
+# than the content. After the app writes to the spreadsheet itself, the snapshot is dropped: the modifiedTime read
+# after the write would also cover an edit someone else has done in the meantime, which the snapshot would not contain.
+# So the snapshot saves the download only in the cycles following a cycle which has not changed anything.
+# The snapshot is kept in memory and on disk (so a restarted process starts from it), compressed and with each
+# distinct cell format stored only once.
+
+import logging
+import os
+import pickle
+import threading
+import zlib
+
+from common.clients import google_service, execute_google
+from common.constants import SPREADSHEET_ID
+from common.files import app_path, write_atomically
+from common.formatting import format_key
+
+DEFAULT_PATH = app_path('snapshot.bin')
+# bump when the structure of the file changes, the files of the other versions are ignored
+FORMAT_VERSION = 1
+
+_lock = threading.Lock()
+# path: where the snapshot is stored, snapshot: (modifiedTime, metadata, tabsData) of the last loaded/saved one
+_state = {'path': DEFAULT_PATH, 'snapshot': None, 'driveFailed': False}
+
+def configure(path=DEFAULT_PATH):
+    with _lock:
+        _state['path'] = path
+        _state['snapshot'] = None
+
+# the modifiedTime of the spreadsheet or None if it can not be found out (e.g. the token has been created before
+# the app asked for the drive.metadata.readonly scope)
+def remote_version(creds=None):
+    try:
+        files = google_service('drive', 'v3', creds).files()
+        version = execute_google('drive', 'files.get', files.get(fileId=SPREADSHEET_ID, fields='modifiedTime'))['modifiedTime']
+        _state['driveFailed'] = False
+        return version
+    except Exception as e:
+        if not _state['driveFailed']:
+            logging.warning(f'Can not find out if the spreadsheet has changed, it will be loaded whole each cycle '
+                            f'(if the token.pickle has been created before the drive.metadata.readonly scope has been added, delete it): {e}')
+            _state['driveFailed'] = True
+        return None
+
+def _encode(version, metadata, tabsData):
+    formats = []
+    formatIds = {}
+    tabs = {}
+    for title, (data, tabFormats) in tabsData.items():
+        formatRows = []
+        for rowFormats in tabFormats:
+            row = []
+            for format in rowFormats:
+                key = format_key(format)
+                if key not in formatIds:
+                    formatIds[key] = len(formats)
+                    formats.append(format)
+                row.append(formatIds[key])
+            formatRows.append(row)
+        tabs[title] = (data, formatRows)
+    return zlib.compress(pickle.dumps({'formatVersion': FORMAT_VERSION, 'version': version, 'metadata': metadata, 'formats': formats, 'tabs': tabs}))
+
+def _decode(content):
+    snapshot = pickle.loads(zlib.decompress(content))
+    if snapshot.get('formatVersion') != FORMAT_VERSION:
+        return None
+    formats = snapshot['formats']
+    # the cells with the same format share the same dict
+    tabsData = {title: (data, [[formats[formatId] for formatId in row] for row in formatRows]) for title, (data, formatRows) in snapshot['tabs'].items()}
+    return (snapshot['version'], snapshot['metadata'], tabsData)
+
+# Returns (metadata, tabsData) of the snapshot if it is of the given version, None otherwise.
+# The returned data is shared with the snapshot, it must not be modified.
+def load(version):
+    if version is None:
+        return None
+    with _lock:
+        if _state['snapshot'] is None and os.path.exists(_state['path']):
+            try:
+                with open(_state['path'], 'rb') as file:
+                    _state['snapshot'] = _decode(file.read())
+            except Exception as e:
+                logging.warning(f'Can not read the snapshot {_state["path"]}, ignoring it: {e}')
+        snapshot = _state['snapshot']
+        if snapshot is None or snapshot[0] != version:
+            return None
+        return (snapshot[1], snapshot[2])
+
+# forgets the snapshot, the next load finds none
+def invalidate():
+    with _lock:
+        _state['snapshot'] = None
+        if os.path.exists(_state['path']):
+            os.remove(_state['path'])
+
+# remembers the content of the spreadsheet of the given version (read before the content has been loaded)
+def save(version, metadata, tabsData):
+    if version is None:
+        return
+    with _lock:
+        _state['snapshot'] = (version, metadata, tabsData)
+        write_atomically(_state['path'], _encode(version, metadata, tabsData), 'wb')
@@ -0,0 +1,77 @@
+# Local store of the state of the stateful filters: when has the filter been executed the last time and which issues
+# have changed which field since the changes have been cleared. The filters are identified by their id: param.
+# The store is the authoritative state: the lastExecutedTimestamp: in the config tab is read only once, to import
+# the state of a filter which is not in the store yet, and is not updated anymore. If the store is lost, the filters
+# start again from that timestamp. So by default it is kept next to the app, regardless of the working directory.
+# Each filter also remembers whether its state has been written to the spreadsheet, so that a row missing because the
+# write of the last cycle has failed is not taken as the row removed by the user.
+
+import sqlite3
+import threading
+
+from common.files import app_path
+
+DEFAULT_PATH = app_path('state.sqlite')
+
+SCHEMA = [
+    'CREATE TABLE IF NOT EXISTS filters (id TEXT PRIMARY KEY, last_executed REAL NOT NULL, written INTEGER NOT NULL DEFAULT 1)',
+    'CREATE TABLE IF NOT EXISTS changes (filter_id TEXT NOT NULL, field TEXT NOT NULL, issue_key TEXT NOT NULL, PRIMARY KEY (filter_id, field, issue_key))',
+    'CREATE INDEX IF NOT EXISTS changes_by_filter ON changes (filter_id)',
+]
+
+_lock = threading.Lock()
+_db = {'connection': None, 'path': DEFAULT_PATH}
+
+def configure(path=DEFAULT_PATH):
+    with _lock:
+        if _db['connection'] is not None:
+            _db['connection'].close()
+            _db['connection'] = None
+        _db['path'] = path
+
+def _connection():
+    if _db['connection'] is None:
+        # the filters are executed by more threads, the access is serialized by the _lock
+        connection = sqlite3.connect(_db['path'], check_same_thread=False)
+        for statement in SCHEMA:
+            connection.execute(statement)
+        # the stores created before the written column have been written by the cycles which have saved them
+        if 'written' not in {column[1] for column in connection.execute('PRAGMA table_info(filters)')}:
+            connection.execute('ALTER TABLE filters ADD COLUMN written INTEGER NOT NULL DEFAULT 1')
+        connection.commit()
+        _db['connection'] = connection
+    return _db['connection']
+
+# returns (last executed timestamp, {field: {issue key: True}}, whether it has been written) of the filter or None
+# if it is not known yet. The issue keys are in dicts used as ordered sets, in the order in which they have been saved.
+def load(filterId):
+    with _lock:
+        connection = _connection()
+        row = connection.execute('SELECT last_executed, written FROM filters WHERE id = ?', (filterId,)).fetchone()
+        if row is None:
+            return None
+
+        changes = {}
+        for field, issueKey in connection.execute('SELECT field, issue_key FROM changes WHERE filter_id = ? ORDER BY rowid', (filterId,)):
+            if field not in changes:
+                changes[field] = {}
+            changes[field][issueKey] = True
+        return (row[0], changes, bool(row[1]))
+
+# replaces the state of the filter by the given one, it is not written until mark_written()
+def save(filterId, lastExecuted, changes):
+    with _lock:
+        connection = _connection()
+        with connection:
+            connection.execute('INSERT OR REPLACE INTO filters (id, last_executed, written) VALUES (?, ?, 0)', (filterId, lastExecuted))
+            connection.execute('DELETE FROM changes WHERE filter_id = ?', (filterId,))
+            connection.executemany(
+                'INSERT INTO changes (filter_id, field, issue_key) VALUES (?, ?, ?)',
+                ((filterId, field, issueKey) for field in changes for issueKey in changes[field]))
+
+# the states saved so far have been written to the spreadsheet
+def mark_written():
+    with _lock:
+        connection = _connection()
+        with connection:
+            connection.execute('UPDATE filters SET written = 1 WHERE written = 0')
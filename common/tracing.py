@@ -0,0 +1,70 @@
+# The timeline of one cycle: how long each stage (loading the spreadsheet, the config, each plugin job, each api call,
+# refreshing and writing the tabs...) has taken and on which thread. The spans are exported in the Chrome trace event
+# format, the file can be opened by chrome://tracing or https://ui.perfetto.dev.
+# Nothing is recorded unless a file to export to is configured.
+
+import json
+import os
+import threading
+import time
+from contextlib import contextmanager, nullcontext
+
+from common.files import write_atomically
+
+_lock = threading.Lock()
+# path: where the trace is exported to (None disables the tracing), events: the spans of the current cycle,
+# threads: thread id -> name of the threads which have recorded some span
+_state = {'path': None, 'events': [], 'threads': {}, 'start': time.perf_counter()}
+
+def configure(path=None):
+    with _lock:
+        _state['path'] = path
+    start_cycle()
+
+# starts a new timeline, the spans of the previous cycle are dropped
+def start_cycle():
+    with _lock:
+        _state['events'] = []
+        _state['threads'] = {}
+        _state['start'] = time.perf_counter()
+
+def _micros(perfCounter):
+    return (perfCounter - _state['start']) * 1000000
+
+@contextmanager
+def _span(name, category, args):
+    start = time.perf_counter()
+    try:
+        yield
+    finally:
+        end = time.perf_counter()
+        thread = threading.current_thread()
+        event = {'name': name, 'cat': category, 'ph': 'X', 'ts': _micros(start), 'dur': (end - start) * 1000000,
+                 'pid': os.getpid(), 'tid': thread.ident}
+        if args:
+            event['args'] = args
+        with _lock:
+            _state['events'].append(event)
+            _state['threads'][thread.ident] = thread.name
+
+# Measures the code inside of the with block as one span of the timeline, e.g.
+#   with tracing.span('load_confg'):
+# args: shown with the span (e.g. which filters the job executes)
+def span(name, category='cycle', args=None):
+    if _state['path'] is None:
+        return nullcontext()
+    return _span(name, category, args)
+
+# the spans recorded since the start of the cycle in the Chrome trace event format
+def to_chrome_trace():
+    with _lock:
+        pid = os.getpid()
+        threadNames = [{'name': 'thread_name', 'ph': 'M', 'pid': pid, 'tid': tid, 'args': {'name': name}}
+                       for tid, name in _state['threads'].items()]
+        return {'traceEvents': threadNames + sorted(_state['events'], key=lambda event: event['ts']), 'displayTimeUnit': 'ms'}
+
+# writes the timeline of the cycle to the configured file (replacing the one of the previous cycle)
+def export():
+    if _state['path'] is None:
+        return
+    write_atomically(_state['path'], json.dumps(to_chrome_trace()))
@@ -1,97 +1,75 @@
 from __future__ import print_function
 
-import json
-import os
 from datetime import datetime
 import time
 import logging
 import sys
-import getopt
+from functools import partial
 
-from googleapiclient.discovery import build
-from google.auth.transport.requests import Request
 from common.constants import *
-from common.googleapi import authenticate_google
-from common.formatting import boldFormat, sectionFormat
+from common.clients import google_credentials, google_service, execute_google
+from common.formatting import sectionFormat
+from common.sheetdiff import diff_requests
+from common.batchupdate import split_requests
+from common.executor import execute_concurrently, DEFAULT_MAX_WORKERS, DEFAULT_MAX_WORKERS_PER_GROUP
+from common.config import load_config, parse_row
+from common.options import get_options, get_option, get_flag, get_int_option, get_dict_option
+from common import querycache, scheduler, statestore, metrics, ratelimit, snapshot, history, tracing, profiler
+from plugins import load_plugins, IMPORT_PROFILE
 
 def sheet(creds):
-    spreadsheetService = build('sheets', 'v4', credentials=creds, cache_discovery=False)
-    return spreadsheetService.spreadsheets()
+    return google_service('sheets', 'v4', creds).spreadsheets()
 
-def parse_row(row, params, formattedRow = None, rowid = -1):
-    res = {}
-    for colid, col in enumerate(row):
-        for param in params:
-            if col.startswith(param):
-                res[param] = col[len(param):len(col)].strip()
-                if formattedRow is not None:
-                    res[param + '-format'] = formattedRow[rowid][colid]
-    res[RAW_ROW] = row
-
-    return res
-
-def load_sheet_metadata(creds):
-    sheets = sheet(creds).get(spreadsheetId=SPREADSHEET_ID).execute().get('sheets', [])
-    res = {}
-    for oneSheet in sheets:
-        res[oneSheet['properties']['title']] = oneSheet['properties']['sheetId']
-
-    return res
-
-def load_confg(creds, modules):    
-    formattedRows = normalize_data_and_format(get_sheet_formats_and_data(creds, "config").get('sheets', [])[0].get('data', [])[0].get('rowData', []))
-    data = formattedRows[0]
-    formats = formattedRows[1]
-    
-    res = {}
-    for module_key in modules:
-        res[module_key] = []
-
-    if data:
-        for rowid, row in enumerate(data):
-            if len(row) == 0:
-                continue
-            if row[0] in res:
-                res[row[0]].append(parse_row(row, modules[row[0]].get_config_params(), formats, rowid))
-    return (res, formattedRows)
-
-def clear_spreadsheet(creds, targetRange, sheetId, numOfLinesToClear):
-    deleteRows = {
-        "requests": [
-            {
-            "deleteDimension": {
-                "range": {
-                "sheetId": sheetId,
-                "dimension": "ROWS",
-                "startIndex": 0,
-                "endIndex": numOfLinesToClear - 1
-                }
-            }
-            }
-        ]
-    }
-    sheet(creds).batchUpdate(spreadsheetId=SPREADSHEET_ID, body=deleteRows).execute()
-
-def add_formatted(newValues, row, sheetId, formatBody, formats):
+# loads everything needed for one cycle in one call: the metadata of the tabs and the data and formats of all of them
+# returns a tuple of ({'tab title': sheetId}, {'tab title': (data, formats)})
+def load_spreadsheet(creds):
+    params = {'spreadsheetId': SPREADSHEET_ID,
+              'fields': 'sheets(properties(title,sheetId),data(rowData(values(userEnteredFormat,userEnteredValue))))'}
+    return split_spreadsheet_per_tab(execute_google('sheets', 'get', sheet(creds).get(**params)))
+
+# same as load_spreadsheet but if the spreadsheet has not changed since it has been loaded/written the last time,
+# its content is taken from the local snapshot instead
+def load_spreadsheet_cached(creds):
+    version = snapshot.remote_version(creds)
+    cached = snapshot.load(version)
+    if cached is not None:
+        logging.info('The spreadsheet has not changed, using the local snapshot')
+        return cached
+    sheetMetadata, tabsData = load_spreadsheet(creds)
+    snapshot.save(version, sheetMetadata, tabsData)
+    return (sheetMetadata, tabsData)
+
+def split_spreadsheet_per_tab(spreadsheet):
+    metadata = {}
+    tabsData = {}
+    for oneSheet in spreadsheet.get('sheets', []):
+        title = oneSheet['properties']['title']
+        metadata[title] = oneSheet['properties']['sheetId']
+        data = oneSheet.get('data', [])
+        rowData = data[0].get('rowData', []) if len(data) > 0 else []
+        tabsData[title] = normalize_data_and_format(rowData)
+
+    return (metadata, tabsData)
+
+# the tab names are not case sensitive for the sheets api so they are not for us either
+def find_tab_title(titles, title):
+    for tabTitle in titles:
+        if tabTitle.lower() == title.lower():
+            return tabTitle
+    return None
+
+# returns the Config model of the config tab (see common/config.py)
+def load_confg(tabsData, modules):
+    data, formats = tabsData.get(find_tab_title(tabsData, CONFIG_TAB), ([], []))
+    return load_config(data, formats, modules)
+
+def add_formatted(newValues, newFormats, row, formats):
     newValues.append(row)
-
-    for col, format in enumerate(formats):
-        formatBody['requests'].append({
-                'repeatCell': {
-                    'range': {'startRowIndex': len(newValues) - 1,
-                            'endRowIndex': len(newValues),
-                            'startColumnIndex': col,
-                            'endColumnIndex': col + 1,
-                            'sheetId': sheetId
-                        },
-                    'cell': format,
-                    'fields': 'userEnteredFormat',
-                }
-            })
+    newFormats.append(formats)
 
 # The newVlaues is a list of eiter strings (e.g. value to print to the doc) or a dict
 # which looks like {'value': 'some value to print', 'format': 'the format in which it shold be printed'}
-def add_formatted_from_values(newValues, row, sheetId, formatBody):
+def add_formatted_from_values(newValues, newFormats, row):
     rowValues = []
     rowFormats = []
     for col in row:
@@ -102,7 +80,7 @@ def add_formatted_from_values(newValues, row, sheetId, formatBody):
             rowValues.append(col)
             rowFormats.append({'userEnteredFormat': {'textFormat': {'bold': False}}})
     
-    add_formatted(newValues, rowValues, sheetId, formatBody, rowFormats)
+    add_formatted(newValues, newFormats, rowValues, rowFormats)
 
 # Splits the combination of data and format to two separate parts making sure that there is format for each data entry and vice versa
 def normalize_data_and_format(formattedRows):
@@ -139,57 +117,45 @@ def add_column_heights(numOfRows, sheetId, formatBody):
             }
     formatBody['requests'].append(body)
 
-# toUpdate format:
-# {'the section name': [new values]}
-# The behavior:
-# If the section is in the toUpdate and it has some values (eg non empty list), the section content will be replaced by the values
-# If the section is in the toUpdate and it has an empty list as a value, the whole section will be removed from the result
-# If the section is not in the toUpdate, it will be ignored (e.g. the content of the section will be preserved as is)
-def refresh_spreadsheet(creds, toUpdate, targetRange, sheetMetadata, formattedRows):
-    data = formattedRows[0]
-    formats = formattedRows[1]
-
-    # the output which will be sent to the spreadsheet api
+# the new (values, formats) of the tab with the sections in the toUpdate replaced, see refresh_spreadsheet
+def build_tab(toUpdate, data, formats):
+    # the new content of the tab which will be compared with the current one
     newValues = []
+    newFormats = []
     
     # list of "sections" which have been updated - used to know the "toUpdate" contains something which is not yet present in the spreadsheet
     updatedSections = []
     copyRow = False
-    sheetId = sheetMetadata[targetRange]
-
-    formatBody = {
-        'requests': []
-    }
 
     for sourceDataIndex, row in enumerate(data):
         if len(row) > 0 and row[0].startswith(SECTION):
             section = parse_row(row, [SECTION])[SECTION]
             if section in toUpdate and len(toUpdate[section]) != 0:
-                add_formatted(newValues, row, sheetId, formatBody, sectionFormat())
+                add_formatted(newValues, newFormats, row, sectionFormat())
                 updatedSections.append(section)
 
                 for newValue in toUpdate[section]:
-                    add_formatted_from_values(newValues, newValue, sheetId, formatBody)
+                    add_formatted_from_values(newValues, newFormats, newValue)
                 # content replaced by new values (e.g. updated), ignore the original values until next section
                 copyRow = False
             if section in toUpdate and len(toUpdate[section]) == 0:
                 # it needs to be completely removed, ignore all other rows
                 copyRow = False
             if section not in toUpdate:
-                add_formatted(newValues, row, sheetId, formatBody, sectionFormat())
+                add_formatted(newValues, newFormats, row, sectionFormat())
                 # no mention in the toUpdate, just copy the conent over
                 copyRow = True
         else:
             if copyRow:
                 # copy
-                add_formatted(newValues, row, sheetId, formatBody, formats[sourceDataIndex])
+                add_formatted(newValues, newFormats, row, formats[sourceDataIndex])
 
     for newSection in toUpdate:
         # this is a new section, needs to be added to the output
         if newSection not in updatedSections and len(toUpdate[newSection]) != 0:
-            add_formatted(newValues, [SECTION + ' ' + newSection], sheetId, formatBody, sectionFormat())
+            add_formatted(newValues, newFormats, [SECTION + ' ' + newSection], sectionFormat())
             for newValue in toUpdate[newSection]:
-                add_formatted_from_values(newValues, newValue, sheetId, formatBody)
+                add_formatted_from_values(newValues, newFormats, newValue)
 
     # this is a hack - the point is that it is not possible to delete all the rows; at least one needs to stay.
     # If that one row contains some data/formats, it might cause issues. Especially if that one row was meant to
@@ -198,86 +164,282 @@ def refresh_spreadsheet(creds, toUpdate, targetRange, sheetMetadata, formattedRo
     if len(newValues) > 0:
         clearedLastRow = [v for v in newValues[-1] if v != '']
         if not (len(clearedLastRow) == 1 and clearedLastRow[0] == '_'):
-            newValues.append(['_'])
+            add_formatted_from_values(newValues, newFormats, ['_'])
     else:
-        newValues.append(['_'])
-
-    add_column_heights(len(newValues), sheetId, formatBody)
-    write_to_spreadsheet(creds, newValues, targetRange, sheetId, formatBody, len(data))
+        add_formatted_from_values(newValues, newFormats, ['_'])
 
-def write_to_spreadsheet(creds, values, targetRange, sheetId, formatBody, numOfLinesToClear):
-    clear_spreadsheet(creds, targetRange, sheetId, numOfLinesToClear)
+    return (newValues, newFormats)
 
-    body = {
-        'values': values
-    }
-    sheet(creds).values().update(
-        spreadsheetId=SPREADSHEET_ID, range=targetRange,
-        valueInputOption='USER_ENTERED', body=body).execute()
-
-    if formatBody is not None:
-        sheet(creds).batchUpdate(spreadsheetId=SPREADSHEET_ID, body=formatBody).execute()
-
-def extract_from_config(config, key, allowDuplicates=True):
-    res = []
-    for instance in config:
-        for category in config[instance]:
-            val = category[key]
-            if allowDuplicates or val not in res:
-                res.append(val)
+# toUpdate format:
+# {'the section name': [new values]}
+# The behavior:
+# If the section is in the toUpdate and it has some values (eg non empty list), the section content will be replaced by the values
+# If the section is in the toUpdate and it has an empty list as a value, the whole section will be removed from the result
+# If the section is not in the toUpdate, it will be ignored (e.g. the content of the section will be preserved as is)
+# Returns the new (data, formats) of the tab and the batchUpdate requests writing it, None if it has not changed.
+# Nothing is written here, the requests of all the tabs are written together by write_to_spreadsheet.
+def refresh_spreadsheet(toUpdate, targetRange, sheetMetadata, formattedRows):
+    data = formattedRows[0]
+    formats = formattedRows[1]
+    sheetId = sheetMetadata[targetRange]
 
+    with tracing.span('build_tab', args={'tab': targetRange}):
+        newValues, newFormats = build_tab(toUpdate, data, formats)
+
+    # only the rows which differ from what is already in the tab are sent
+    with tracing.span('diff', args={'tab': targetRange}):
+        body = {
+            'requests': diff_requests(sheetId, data, formats, newValues, newFormats)
+        }
+    record_tab_metrics(targetRange, len(newValues), body['requests'])
+    if len(body['requests']) == 0:
+        logging.info(f'Tab {targetRange} has not changed, nothing to write')
+        return None
+
+    add_column_heights(len(newValues), sheetId, body)
+    return (newValues, newFormats, body['requests'])
+
+# how big the tab is and how much is written to it (the rows and the requests by type, e.g. repeatCell for the formats)
+def record_tab_metrics(tab, numOfRows, requests):
+    metrics.set_gauge('tab_rows', {'tab': tab}, numOfRows)
+    for request in requests:
+        requestType = next(iter(request))
+        metrics.inc('tab_requests_total', {'tab': tab, 'type': requestType})
+        if requestType == 'updateCells' and 'rows' in request['updateCells']:
+            metrics.inc('tab_written_rows_total', {'tab': tab}, len(request['updateCells']['rows']))
+
+# Sends the requests of all the tabs refreshed in the cycle in one batchUpdate, which the api applies atomically,
+# so nobody sees a tab half written. Only if they do not fit into one are they sent in more size-bounded batchUpdates.
+def write_to_spreadsheet(creds, requests):
+    batches = split_requests(requests)
+    for batch in batches:
+        with tracing.span('write', args={'requests': len(batch['requests'])}):
+            # inserts and deletes rows, applying it twice would break the tab
+            execute_google('sheets', 'batchUpdate', sheet(creds).batchUpdate(spreadsheetId=SPREADSHEET_ID, body=batch), ratelimit.PRIORITY_WRITE, idempotent=False)
+    metrics.inc('write_batches_total', amount=len(batches))
+    logging.info(f'Written {len(requests)} requests by {len(batches)} batchUpdate(s)')
+
+# {id: row} of the rows of the tab which contain an id: (printed by the stateful filters), the first one wins
+def index_rows_by_id(data):
+    res = {}
+    for row in data:
+        filterId = parse_row(row, [ID]).get(ID)
+        if filterId is not None and filterId not in res:
+            res[filterId] = row
     return res
 
-def find_column_index_by_prefix(row, prefix):
-    for colId, col in enumerate(row):
-        if col.startswith(TIMESTAMP):
-            return colId
-    return -1
-
-def add_or_replace_timestamp(row, timestamp):
-    colId = find_column_index_by_prefix(row, TIMESTAMP)
-    if colId == -1:
-        row.append(f'{TIMESTAMP}{timestamp}')
-    else:
-        row[colId] = (f'{TIMESTAMP}{timestamp}')
-
-def find_row_index(rows, key, value):
-    for id, row in enumerate(rows):
-        for col in row:
-            if col.startswith(key):
-                val = col[len(key):len(col)].strip()
-                if val == value:
-                    return id
-    return -1
-
-def set_timestamp_in_config(rawConfig, id, timestamp):
-    data = rawConfig[1][0]
-    rowIndex = find_row_index(data, ID, id)
-    if rowIndex != -1:
-        add_or_replace_timestamp(data[rowIndex], timestamp)
-
-def get_sheet_formats_and_data(creds, targetRange):
-    params = {'spreadsheetId': SPREADSHEET_ID,
-              'ranges': targetRange,
-              'fields': 'sheets(data(rowData(values(userEnteredFormat,userEnteredValue)),startColumn,startRow))'}
-    return sheet(creds).get(**params).execute()
-
-def load_data_per_tab(creds, tabs):
+def load_data_per_tab(tabsData, tabs):
     currentData = {}
     for tab in tabs:
-        currentData[tab] = normalize_data_and_format(get_sheet_formats_and_data(creds, tab).get('sheets', [])[0].get('data', [])[0].get('rowData', []))
+        currentData[tab] = tabsData.get(tab, ([], []))
     return currentData
 
 def is_stateful(config):
     return config.get(STATEFUL, 'false') == 'true'
 
-def find_prev_row(config, rows, id):
-    data = rows[0]
-    rowIndex = find_row_index(data, ID, id)
-    if rowIndex == -1:
+# Returns (lastExecutedTs, prevChanges) to call the stateful filter with, or None if it has never been executed
+# (then only the current time is remembered and there is nothing to print yet).
+# prevRows: tab -> {id: row} of the rows printed by the stateful filters in the previous cycle, only the tabs which exist
+def load_filter_state(plugin, pluginConfig, prevRows):
+    filterId = pluginConfig[ID]
+    tabRows = prevRows.get(pluginConfig[TAB])
+    state = statestore.load(filterId)
+    if state is None:
+        # not in the store yet, import the state kept in the spreadsheet by the previous versions
+        if TIMESTAMP not in pluginConfig:
+            # has never been executed, just remember the current timestamp
+            statestore.save(filterId, datetime.timestamp(datetime.now()), {})
+            return None
+        prevRow = (tabRows or {}).get(filterId, [])
+        prevChanges = plugin.parse_prev_row(prevRow) if hasattr(plugin, 'parse_prev_row') else {}
+        logging.info(f'Imported the state of filter {filterId} from the spreadsheet')
+        return (float(pluginConfig[TIMESTAMP]), prevChanges)
+
+    lastExecuted, changes, written = state
+    if written and tabRows is not None and filterId not in tabRows:
+        # the row has been removed from the tab which resets the changes. If the last write has failed, the row
+        # is missing because it has not been written, the changes are kept then.
+        changes = {}
+    return (lastExecuted, changes)
+
+# stores the state returned by the stateful filter and returns the result to print
+def save_filter_state(pluginConfig, resWithTimestamp):
+    filterId = pluginConfig[ID]
+    statestore.save(filterId, resWithTimestamp[TIMESTAMP], resWithTimestamp[CHANGES])
+    res = resWithTimestamp[RES]
+    if len(res) > 0:
+        res.append(f'{ID}{filterId}')
+    return res
+
+# executes one row of the config by the plugin it belongs to and returns the result to print
+def execute_filter(plugin, pluginConfig, prevRows):
+    if not is_stateful(pluginConfig):
+        return plugin.execute(pluginConfig)
+
+    state = load_filter_state(plugin, pluginConfig, prevRows)
+    if state is None:
         return []
-    else:
-        return data[rowIndex]
+    # has been executed already, call the plugin
+    return save_filter_state(pluginConfig, plugin.execute_stateful(pluginConfig, state[1], state[0]))
+
+def execute_filters(plugin, pluginConfigs, prevRows):
+    return [execute_filter(plugin, pluginConfig, prevRows) for pluginConfig in pluginConfigs]
+
+def execute_filters_batch(plugin, pluginConfigs):
+    return plugin.execute_batch(pluginConfigs)
+
+# same as execute_filters for the stateful rows but the plugin gets all of them by one execute_stateful_batch
+# which takes a list of (config, prevChanges, lastExecutedTs) and returns a list of what execute_stateful returns
+def execute_stateful_filters_batch(plugin, pluginConfigs, prevRows):
+    states = [load_filter_state(plugin, pluginConfig, prevRows) for pluginConfig in pluginConfigs]
+    toExecute = [(pluginConfig, state[1], state[0]) for pluginConfig, state in zip(pluginConfigs, states) if state is not None]
+    results = iter(plugin.execute_stateful_batch(toExecute) if len(toExecute) > 0 else [])
+    return [save_filter_state(pluginConfig, next(results)) if state is not None else [] for pluginConfig, state in zip(pluginConfigs, states)]
+
+# the rows the plugin can execute at once split into the batches it wants to get them in (all in one by default)
+def batch_groups(plugin, pluginConfigs):
+    if len(pluginConfigs) == 0:
+        return []
+    if hasattr(plugin, 'batch_groups'):
+        return plugin.batch_groups(pluginConfigs)
+    return [pluginConfigs]
+
+# the name of the filter in the metrics
+def filter_name(pluginConfig):
+    return pluginConfig.get(ID, pluginConfig.get(LABEL, ''))
+
+# measures how long the job takes, both for the plugin and for each of the filters it executes
+# (the filters executed together in one batch all get the time of the whole batch)
+def timed_job(plugin_name, pluginConfigs, job):
+    def run():
+        start = time.perf_counter()
+        try:
+            with tracing.span(plugin_name, 'plugin', {'filters': [filter_name(pluginConfig) for pluginConfig in pluginConfigs]}):
+                return job()
+        finally:
+            duration = time.perf_counter() - start
+            metrics.observe('plugin_job_seconds', {'plugin': plugin_name}, duration)
+            for pluginConfig in pluginConfigs:
+                metrics.observe('filter_seconds', {'plugin': plugin_name, 'filter': filter_name(pluginConfig)}, duration)
+    return run
+
+# Splits the rows of the config belonging to the plugin into jobs which can be executed concurrently.
+# If the plugin can execute more rows at once (has the execute_batch / execute_stateful_batch), its non-stateful /
+# stateful rows are executed by one job per batch (as split by the batch_groups of the plugin, if it has one).
+# The other rows are executed one by one by execute / execute_stateful.
+# Returns a list of (the rows, the job) where the job returns one result per row.
+def plan_filters(plugin, pluginConfigs, prevRows):
+    jobs = []
+    batch = []
+    statefulBatch = []
+    for pluginConfig in pluginConfigs:
+        if not is_stateful(pluginConfig) and hasattr(plugin, 'execute_batch'):
+            batch.append(pluginConfig)
+        elif is_stateful(pluginConfig) and hasattr(plugin, 'execute_stateful_batch'):
+            statefulBatch.append(pluginConfig)
+        else:
+            jobs.append(([pluginConfig], partial(execute_filters, plugin, [pluginConfig], prevRows)))
+    for group in batch_groups(plugin, batch):
+        jobs.append((group, partial(execute_filters_batch, plugin, group)))
+    for group in batch_groups(plugin, statefulBatch):
+        jobs.append((group, partial(execute_stateful_filters_batch, plugin, group, prevRows)))
+    return jobs
+
+# never sleep shorter than this between two cycles in the daemon mode
+MIN_SLEEP = 5
+
+# identifies the row of the config across cycles
+def filter_key(plugin_name, pluginConfig):
+    if ID in pluginConfig:
+        return (plugin_name, pluginConfig[ID])
+    return (plugin_name, tuple(pluginConfig[RAW_ROW]))
+
+def run_cycle(plugins, maxWorkers, maxWorkersPerPlugin):
+    logging.info('Loading common config')
+    with tracing.span('auth'):
+        googleCreds = google_credentials()
+    with tracing.span('load_spreadsheet'):
+        sheetMetadata, tabsData = load_spreadsheet_cached(googleCreds)
+    with tracing.span('load_confg'):
+        config = load_confg(tabsData, plugins)
+    tabs = config.tabs
+    logging.info('Configs loaded')
+
+    logging.info('Executing plugins')
+    results = {}
+    querycache.start_cycle()
+
+    with tracing.span('load_data_per_tab'):
+        currentData = load_data_per_tab(tabsData, tabs)
+        prevRows = {tab: index_rows_by_id(tabsData[tab][0]) for tab in tabs if tab in tabsData}
+    now = time.time()
+    scheduler.retain([filter_key(plugin_name, pluginConfig) for plugin_name in plugins for pluginConfig in config.filters[plugin_name]])
+    jobs = []
+    jobConfigs = []
+    # the tabs containing some filter which is executed in this cycle, only these need to be refreshed
+    executedTabs = set()
+    for plugin_name in plugins:
+        dueConfigs = [pluginConfig for pluginConfig in config.filters[plugin_name] if scheduler.is_due(filter_key(plugin_name, pluginConfig), now)]
+        executedTabs.update(pluginConfig[TAB] for pluginConfig in dueConfigs)
+        for pluginConfigs, job in plan_filters(plugins[plugin_name], dueConfigs, prevRows):
+            jobs.append((plugin_name, timed_job(plugin_name, pluginConfigs, job)))
+            jobConfigs.append(pluginConfigs)
+    logging.info(f'Executing {sum(len(pluginConfigs) for pluginConfigs in jobConfigs)} filters which are due')
+
+    filterResults = {}
+    with tracing.span('execute_filters', args={'jobs': len(jobs)}):
+        executed = execute_concurrently(jobs, maxWorkers, maxWorkersPerPlugin)
+    for pluginConfigs, jobResults in zip(jobConfigs, executed):
+        for pluginConfig, filterResult in zip(pluginConfigs, jobResults):
+            filterResults[id(pluginConfig)] = filterResult
+
+    # the results are merged in the order of the config rows, regardless of which filter has finished first
+    for plugin_name in plugins:
+        pluginRes = {}
+        for pluginConfig in config.filters[plugin_name]:
+            if pluginConfig[TAB] not in pluginRes:
+                pluginRes[pluginConfig[TAB]] = []
+
+            key = filter_key(plugin_name, pluginConfig)
+            if id(pluginConfig) in filterResults:
+                res = filterResults[id(pluginConfig)]
+                scheduler.record_run(key, scheduler.parse_interval(pluginConfig.get(INTERVAL)), res)
+            else:
+                # not due in this cycle, print what it returned last time
+                res = scheduler.last_result(key)
+            if len(res) != 0:
+                pluginRes[pluginConfig[TAB]].append(res)
+
+        results[plugin_name] = pluginRes
+        logging.info(f'Executed plugin {plugin_name}')
+
+    querycache.log_stats()
+    # the counts recorded by the filters executed in this cycle
+    history.flush()
+    logging.info('All plugins executed, updating output spreadsheet')
+    # the requests of all the tabs, written together at the end
+    requests = []
+    for tab in tabs:
+        if tab not in executedTabs:
+            continue
+        toUpdate = {}
+        for plugin_name in results:
+            if tab in results[plugin_name]:
+                toUpdate[plugin_name] = results[plugin_name][tab]
+        logging.info(f'Preparing the update of tab {tab}')
+        written = refresh_spreadsheet(toUpdate, tab, sheetMetadata, currentData[tab])
+        if written is not None:
+            requests.extend(written[2])
+
+    if len(requests) > 0:
+        with tracing.span('write_to_spreadsheet', args={'requests': len(requests)}):
+            write_to_spreadsheet(googleCreds, requests)
+        # The version of the spreadsheet after the write can not tell our write from an edit done by someone else at
+        # about the same time, so the snapshot can not be trusted anymore and the next cycle loads the spreadsheet.
+        snapshot.invalidate()
+    # the rows of the stateful filters are in the tabs now
+    statestore.mark_written()
+    logging.info('All tabs updated')
 
 def main():
     logging.basicConfig(
@@ -286,81 +448,63 @@ def main():
         level=logging.INFO,
         datefmt='%Y-%m-%d %H:%M:%S')
 
-    logging.info('Loading plugins')
-
-    sys.path.append('plugins')
-    plugins = {}
-    for file in os.listdir("plugins"):
-        if file.endswith(".py"):
-            name = file.removesuffix('.py')
-            if name == '__init__':
-                continue
-
-            logging.info(f'Trying to load plguin {name}')
-            module = __import__(name)
-            plugins[module.get_config_key()] = module
-            logging.info(f'Plguin {name} loaded')
-
-    timeout = 10 * 60
+    get_options()
+    maxWorkers = get_int_option('workers', DEFAULT_MAX_WORKERS)
+    pluginWorkers = get_dict_option('plugin-workers')
+    maxWorkersPerPlugin = lambda plugin_name: int(pluginWorkers.get(plugin_name, DEFAULT_MAX_WORKERS_PER_GROUP))
+    querycache.configure(
+        get_int_option('query-cache-ttl', querycache.DEFAULT_TTL),
+        get_int_option('query-cache-size', querycache.DEFAULT_MAX_ENTRIES))
+    statestore.configure(get_option('state-file', statestore.DEFAULT_PATH))
+    snapshot.configure(get_option('snapshot-file', snapshot.DEFAULT_PATH))
+    history.configure(get_option('history-file', history.DEFAULT_PATH))
+    metricsFile = get_option('metrics-file')
+    ratelimit.configure(get_dict_option('rate-limits'))
+    tracing.configure(get_option('trace-file'))
+    profile = get_flag('profile')
+
+    # the plugins are only registered here, each is imported once some row of the config needs it
+    with tracing.span('load_plugins'):
+        plugins = load_plugins()
+    logging.info(f'Registered plugins {", ".join(plugins)}')
+
+    daemon = get_flag('daemon')
     while True:
-        logging.info('Loading common config')
-        googleCreds = authenticate_google()
-        sheetMetadata = load_sheet_metadata(googleCreds)
-        rawConfig = load_confg(googleCreds, plugins)
-        config = rawConfig[0]
-        tabs = extract_from_config(config, TAB, False)
-        logging.info('Configs loaded')
-
-        logging.info('Executing plugins')
-        results = {}
-
-        currentData = load_data_per_tab(googleCreds, tabs)
-        for plugin_name in plugins:
-            logging.info(f'Executing plugin {plugin_name}')
-            pluginRes = {}
-            for pluginConfig in config[plugin_name]:
-                if pluginConfig[TAB] not in pluginRes:
-                    pluginRes[pluginConfig[TAB]] = []
-
-                if is_stateful(pluginConfig):
-                    res = []
-                    if TIMESTAMP in pluginConfig:
-                        # has been executed already, call the plugin
-                        resWithTimestamp = plugins[plugin_name].execute_stateful(
-                            pluginConfig,
-                            find_prev_row(pluginConfig, currentData[pluginConfig[TAB]], pluginConfig[ID]),
-                            float(pluginConfig[TIMESTAMP])
-                            )
-                        res = resWithTimestamp[RES]
-                        if len(res) > 0:
-                            res.append(f'{ID}{pluginConfig[ID]}')
-                        set_timestamp_in_config(rawConfig, pluginConfig[ID], resWithTimestamp[TIMESTAMP])
-                    else:
-                        # has never been executed, just remember the current timestamp
-                        set_timestamp_in_config(rawConfig, pluginConfig[ID], datetime.timestamp(datetime.now()))
-                else:
-                    res = plugins[plugin_name].execute(pluginConfig)
-                if len(res) != 0:
-                    pluginRes[pluginConfig[TAB]].append(res)
-
-            results[plugin_name] = pluginRes
-            logging.info(f'Executed plugin {plugin_name}')
-
-        logging.info('All plugins executed, updating output spreadsheet')
-        for tab in tabs:
-            toUpdate = {}
-            for plugin_name in results:
-                if tab in results[plugin_name]:
-                    toUpdate[plugin_name] = results[plugin_name][tab]
-            logging.info(f'Updating tab {tab}')
-            refresh_spreadsheet(googleCreds, toUpdate, tab, sheetMetadata, currentData[tab])
-
-        logging.info('Updating tab Config')
-        refresh_spreadsheet(googleCreds, [], 'Config', sheetMetadata, rawConfig[1])
-        logging.info(f'All tabs updated, sleeping for {timeout}s')
-
-        break
-        time.sleep(timeout)
+        cycleStart = time.perf_counter()
+        if profile:
+            profiler.start()
+        try:
+            with tracing.span('cycle'):
+                run_cycle(plugins, maxWorkers, maxWorkersPerPlugin)
+            metrics.inc('cycles_total', {'result': 'success'})
+        except Exception:
+            metrics.inc('cycles_total', {'result': 'failure'})
+            if not daemon:
+                raise
+            # one failed cycle (e.g. some api not responding) should not kill the daemon, the next one will try again
+            logging.exception('Cycle failed')
+        finally:
+            cycleDuration = time.perf_counter() - cycleStart
+            metrics.observe('cycle_seconds', None, cycleDuration)
+            metrics.set_gauge('last_cycle_seconds', None, cycleDuration)
+            metrics.set_gauge('last_cycle_timestamp', None, time.time())
+            for plugin_name, imported in IMPORT_PROFILE.items():
+                metrics.set_gauge('plugin_import_seconds', {'plugin': plugin_name}, imported['seconds'])
+            if metricsFile is not None:
+                metrics.export(metricsFile)
+            tracing.export()
+            # the timeline of the first cycle contains also the loading of the plugins
+            tracing.start_cycle()
+            if profile:
+                profiler.stop()
+                profiler.write()
+
+        if not daemon:
+            break
+
+        sleepFor = min(max(scheduler.seconds_until_next_run(), MIN_SLEEP), scheduler.DEFAULT_INTERVAL)
+        logging.info(f'Sleeping for {sleepFor:.0f}s')
+        time.sleep(sleepFor)
 
 if __name__ == '__main__':
     main()
@@ -371,7 +515,5 @@ if __name__ == '__main__':
 # send a notification under some conditions
 # if there is exactly one BZ which satisfies the filter, the result is just "1" without the split + all etc
 # add option to have WIP limits
-# optimize: the sheet() does not need to be called repeatedly
 # format the section titles to be prettier
 # add support for conditional formatting (e.g. if the num of bugs is higher than X than make it red)
-# add validations of params from the "config" tab - currently the app crashes if something is missing
\ No newline at end of file
@@ -0,0 +1,63 @@
+# The manifest of the plugins: the key of each plugin in the config tab, the module implementing it and the params
+# its rows can have. The config tab can be parsed by the manifest alone, the module of a plugin (together with the
+# client libraries it needs, e.g. jira) is imported only once a row of the config needs it.
+# To add a plugin, add it here; its module needs to provide the execute(config) (and optionally execute_stateful...)
+# and get_config_key()/get_config_params() returning the same as the manifest.
+# A plugin which can execute more rows at once (e.g. by merging their queries into one) can also provide
+# execute_batch(configs) and/or execute_stateful_batch([(config, prevChanges, lastExecutedTs)]) returning one result
+# per row, and batch_groups(configs) returning the lists of the rows to execute together (all of them by default).
+
+import importlib
+import logging
+import sys
+import threading
+import time
+
+from common import tracing
+from common.constants import LABEL, TAB, QUERY, SPLIT_BY, SORT, INTERVAL, MAX_RESULTS, IGNORE_FIELDS, MENTIONS, ID, STATEFUL, RESTRICT_TIME, TIMESTAMP, SPLIT, COUNT, TREND
+
+MANIFEST = {
+    'bz-filter': {'module': 'plugins.bz', 'params': [LABEL, TAB, QUERY, SPLIT_BY, SORT, TREND, INTERVAL]},
+    'jira-filter': {'module': 'plugins.jiraplugin', 'params': [LABEL, TAB, QUERY, SPLIT_BY, SORT, TREND, MAX_RESULTS, IGNORE_FIELDS, MENTIONS, ID, STATEFUL, RESTRICT_TIME, TIMESTAMP, SPLIT, INTERVAL]},
+    'gmail-filter': {'module': 'plugins.gmail', 'params': [LABEL, TAB, QUERY, COUNT, INTERVAL]},
+}
+
+# config key -> {'seconds': how long the import took, 'modules': how many modules it has imported}
+IMPORT_PROFILE = {}
+
+_lock = threading.Lock()
+
+def config_params(configKey):
+    return MANIFEST[configKey]['params']
+
+# Stands for the plugin until it is used: the key and params come from the manifest, anything else imports the module.
+class LazyPlugin:
+    def __init__(self, configKey):
+        self._configKey = configKey
+        self._module = None
+
+    def get_config_key(self):
+        return self._configKey
+
+    def get_config_params(self):
+        return config_params(self._configKey)
+
+    def load(self):
+        if self._module is None:
+            with _lock:
+                if self._module is None:
+                    numOfModules = len(sys.modules)
+                    start = time.perf_counter()
+                    with tracing.span(f'import {self._configKey}', 'plugin'):
+                        module = importlib.import_module(MANIFEST[self._configKey]['module'])
+                    IMPORT_PROFILE[self._configKey] = {'seconds': time.perf_counter() - start, 'modules': len(sys.modules) - numOfModules}
+                    logging.info(f'Plugin {self._configKey} loaded in {IMPORT_PROFILE[self._configKey]["seconds"]:.3f}s ({IMPORT_PROFILE[self._configKey]["modules"]} modules imported)')
+                    self._module = module
+        return self._module
+
+    def __getattr__(self, name):
+        return getattr(self.load(), name)
+
+# config key -> LazyPlugin of all the plugins in the manifest
+def load_plugins():
+    return {configKey: LazyPlugin(configKey) for configKey in MANIFEST}
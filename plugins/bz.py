@@ -1,66 +1,202 @@
-import os.path
-import logging
-import sys
-import requests
+from concurrent.futures import ThreadPoolExecutor
+from urllib.parse import parse_qsl, urlencode
 
-from common.constants import TAB, LABEL, SPLIT_BY, QUERY, SORT
-from common.formatting import formatted_label_from_config
-from common.helpers import split_issues, split_array_from_config
+from common.constants import QUERY
+from common.helpers import group_issues, group_issues_many, issue_cells, split_dimensions
+from common.clients import http_session, call
+from common.links import key_list_urls
+from common import credentials, querycache
+from plugins import config_params
+
+BZ_BASE_URL = 'https://bugzilla.redhat.com'
+# how many bugs are loaded by one request
+PAGE_SIZE = 500
+# how many pages of one query are loaded at the same time
+PAGE_WORKERS = 4
+# The params of the query which bugzilla ORs when they are given more times (product=a&product=b) -> the field of the bug
+# they are matched against. The queries differing only in one of them are loaded by one query and each of them gets
+# the bugs having its values.
+MERGEABLE_PARAMS = {'product': 'product', 'component': 'component', 'bug_status': 'status', 'status': 'status', 'priority': 'priority',
+                    'bug_severity': 'severity', 'severity': 'severity', 'resolution': 'resolution'}
+# the queries containing these params can not be merged with the others, the limit would apply to all of them together
+NOT_MERGEABLE_PARAMS = {'limit', 'offset'}
+# the values which bugzilla expands to a set of values (e.g. bug_status=__open__), the queries containing them are not merged
+META_VALUE_PREFIX = '__'
+# the values by which the query asks for an empty field -> the value of the field returned by the api,
+# e.g. the open bugs are queried by resolution=--- but have "resolution": ""
+EMPTY_FIELD_VALUES = {'---': ''}
 
 # the key in the config tab in the spreadsheet which this module represents
 def get_config_key():
     return 'bz-filter'
 
 def get_config_params():
-    return [LABEL, TAB, QUERY, SPLIT_BY, SORT]
-
-def load_bz_api_key():
-    msg = 'Problem loading bugzilla API key. Please login to bugzilla web interface, go to Preferences->API Keys, generate a new one and paste it into a file named bz.apikey next to this file.'
-    if os.path.exists('bz.apikey'):
-        with open('bz.apikey', 'r') as apiKey:
-            key = apiKey.readline().strip()
-            if key is None:
-                logging.error(msg)
-            # FIXME - dont return None here to crash later or at least handle later
-            return key
-    else:
-        logging.error(msg)
-
-def sortOutput(config):
-    def actualSort(unsorted):
-        if SORT not in config:
-            return unsorted
-
-        res = []
-        sortedItems = split_array_from_config(config, SORT)
-
-        # first the explicitely asked order
-        for item in sortedItems:
-            if item in unsorted:
-                res.append(item)
-
-        # than all the rest
-        for item in unsorted:
-            if item not in sortedItems:
-                res.append(item)
-        return res
-
-    return actualSort
+    return config_params(get_config_key())
 
-def execute(config):
-    apiKey = load_bz_api_key()
+# the api key is read only once per process by the credential manager
+def bz_headers():
+    apiKey = credentials.bugzilla_api_key()
+    if apiKey is None:
+        raise RuntimeError('Bugzilla API key not available, see the bz.apikey file')
+    return {'Content-Type': 'application/json', 'Accpet': 'application/json', 'Authorization': 'Bearer ' + apiKey}
+
+# only the fields which are actually used are loaded: the id and the fields the result is split by
+def needed_fields(config):
+    return ['id'] + split_dimensions(config)
+
+# the same params in a different order are the same query
+def normalize_query(query):
+    return urlencode(sorted(parse_qsl(query, keep_blank_values=True)))
+
+def load_page(query, headers, offset=None):
+    url = f'{BZ_BASE_URL}/rest/bug?{query}'
+    if offset is not None:
+        url = f'{url}&limit={PAGE_SIZE}&offset={offset}'
+    def send():
+        response = http_session('bugzilla').get(url, headers=headers)
+        # the errors (e.g. 429 or 503 when bugzilla is overloaded) are raised so that the call can be retried
+        response.raise_for_status()
+        return response
+    return call('bugzilla', 'bug', send, len(url), lambda response: len(response.content)).json()
+
+# Yields the bugs satisfying the query page by page so the whole result does not need to be held in memory at once.
+# If bugzilla tells how many bugs there are in total, the rest of the pages is loaded concurrently after the first one.
+def load_bugs(query, fields, headers):
+    fieldsQuery = f'{query}&include_fields={",".join(fields)}'
+    queryParams = dict(parse_qsl(query))
+    if 'limit' in queryParams:
+        # the query asks for a specific number of results itself, no need to page
+        yield from load_page(fieldsQuery, headers)['bugs']
+        return
+    if 'order' not in queryParams:
+        # the pages need a stable order otherwise some bugs could be skipped or returned twice
+        fieldsQuery = f'{fieldsQuery}&order=bug_id'
+
+    firstPage = load_page(fieldsQuery, headers, 0)
+    yield from firstPage['bugs']
+    if len(firstPage['bugs']) < PAGE_SIZE:
+        return
+
+    total = firstPage.get('total_matches')
+    if total is not None:
+        with ThreadPoolExecutor(max_workers=PAGE_WORKERS) as executor:
+            for page in executor.map(lambda offset: load_page(fieldsQuery, headers, offset), range(PAGE_SIZE, total, PAGE_SIZE)):
+                yield from page['bugs']
+        return
+
+    offset = PAGE_SIZE
+    while True:
+        page = load_page(fieldsQuery, headers, offset)
+        yield from page['bugs']
+        if len(page['bugs']) < PAGE_SIZE:
+            return
+        offset += PAGE_SIZE
+
+def bug_id(bz):
+    return bz['id']
 
-    headers = {'Content-Type': 'application/json', 'Accpet': 'application/json', 'Authorization': 'Bearer ' + apiKey}
-    raw = requests.get(f'https://bugzilla.redhat.com/rest/bug?{config[QUERY]}', headers=headers)
-    bzs = raw.json()['bugs']
+def bug_value(bz, splitBy):
+    return bz[splitBy]
 
-    return split_issues(
+# The bugs are grouped (see group_issues) as they are loaded and only the groups are cached, so the bugs of a large
+# query do not need to be held in memory. The configs with the same query and splitBy: share them.
+def cache_key(config):
+    return (normalize_query(config[QUERY]), tuple(split_dimensions(config)))
+
+def bug_cells(config, grouped):
+    return issue_cells(
         config,
-        bzs,
-        f'https://bugzilla.redhat.com/buglist.cgi?{config[QUERY]}',
-        lambda issues: 'https://bugzilla.redhat.com/buglist.cgi?f1=bug_id&o1=anyexact&query_format=advanced&v1=' + ",".join([str(int) for int in issues]),
-        lambda bz: bz['id'],
-        lambda bz, splitBy: bz[splitBy],
-        sortOutput(config)
-    )
-    
\ No newline at end of file
+        grouped,
+        f'{BZ_BASE_URL}/buglist.cgi?{config[QUERY]}',
+        key_list_urls(f'{BZ_BASE_URL}/buglist.cgi?f1=bug_id&o1=anyexact&query_format=advanced&v1=', ','))
+
+def execute(config):
+    headers = bz_headers()
+    fields = needed_fields(config)
+    grouped = querycache.fetch(
+        get_config_key(),
+        cache_key(config),
+        fields,
+        lambda: group_issues(split_dimensions(config), load_bugs(config[QUERY], fields, headers), bug_id, bug_value))
+    return bug_cells(config, grouped)
+
+# (the query without the param, the values of the param) or None if the query can not be merged by the param
+def split_query(query, param):
+    params = parse_qsl(query, keep_blank_values=True)
+    if any(name in NOT_MERGEABLE_PARAMS for name, _ in params):
+        return None
+    values = frozenset(value for name, value in params if name == param)
+    if len(values) == 0:
+        return None
+    if any(value.startswith(META_VALUE_PREFIX) for value in values):
+        # not a value of the field, the bugs could not be split back by it
+        return None
+    return (urlencode(sorted((name, value) for name, value in params if name != param)), values)
+
+# the param by which all the queries of the configs can be merged, None if there is none
+def merge_param(configs):
+    for param in MERGEABLE_PARAMS:
+        splits = [split_query(config[QUERY], param) for config in configs]
+        if all(split is not None and split[0] == splits[0][0] for split in splits):
+            return param
+    return None
+
+# Groups the configs whose queries differ only in the values of one of the MERGEABLE_PARAMS, each group is loaded
+# by one query. The params are tried in order, a config is put into the first group it fits. The configs which can
+# not be merged so are grouped by their query, the ones with the same query (e.g. split differently) share one load.
+def batch_groups(configs):
+    groups = []
+    remaining = configs
+    for param in MERGEABLE_PARAMS:
+        byRest = {}
+        for config in remaining:
+            split = split_query(config[QUERY], param)
+            if split is not None:
+                byRest.setdefault(split[0], []).append(config)
+        merged = [group for group in byRest.values() if len(group) > 1]
+        groups.extend(merged)
+        mergedIds = {id(config) for group in merged for config in group}
+        remaining = [config for config in remaining if id(config) not in mergedIds]
+    byQuery = {}
+    for config in remaining:
+        byQuery.setdefault(normalize_query(config[QUERY]), []).append(config)
+    groups.extend(byQuery.values())
+    return groups
+
+# the values of the field of the bug (some fields, e.g. component, are lists) compared case insensitive as bugzilla does
+def field_values(bz, field):
+    value = bz.get(field)
+    values = value if isinstance(value, list) else [value]
+    return {str(value).casefold() for value in values if value is not None}
+
+# Executes the configs of one group returned by batch_groups: the queries of the configs whose groups are not cached
+# yet are merged into one (or are the same query) and the bugs are grouped for each of them as they are loaded, by the
+# values of the merged param if there is one.
+def execute_batch(configs):
+    if len(configs) == 1:
+        return [execute(configs[0])]
+    param = merge_param(configs)
+    if param is None and len({normalize_query(config[QUERY]) for config in configs}) > 1:
+        return [execute(config) for config in configs]
+
+    field = MERGEABLE_PARAMS.get(param)
+    fields = sorted(set([field] if field is not None else []).union(*(needed_fields(config) for config in configs)))
+    headers = bz_headers()
+    def load_grouped(keys):
+        # one config per key, the others with the same key share its groups
+        keys = set(keys)
+        toLoad = {key: config for config, key in zip(configs, map(cache_key, configs)) if key in keys}
+        if param is None:
+            query = next(iter(toLoad.values()))[QUERY]
+            matches = lambda config, bz: True
+        else:
+            splits = [split_query(config[QUERY], param) for config in toLoad.values()]
+            values = sorted(frozenset().union(*(split[1] for split in splits)))
+            query = '&'.join(part for part in [splits[0][0], urlencode([(param, value) for value in values])] if part != '')
+            wanted = {id(config): {EMPTY_FIELD_VALUES.get(value, value).casefold() for value in split[1]} for config, split in zip(toLoad.values(), splits)}
+            matches = lambda config, bz: not wanted[id(config)].isdisjoint(field_values(bz, field))
+        grouped = group_issues_many(list(toLoad.values()), load_bugs(query, fields, headers), matches, bug_id, bug_value)
+        return dict(zip(toLoad, grouped))
+
+    groups = querycache.fetch_many(get_config_key(), [cache_key(config) for config in configs], fields, load_grouped)
+    return [bug_cells(config, grouped) for config, grouped in zip(configs, groups)]
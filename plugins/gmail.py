@@ -1,28 +1,109 @@
-from googleapiclient.discovery import build
+import logging
+import time
+
 from common.formatting import formatted_label_from_config
-from common.constants import LABEL, TAB, QUERY
-from common.googleapi import authenticate_google
+from common.constants import QUERY, COUNT
+from common.clients import google_service, call, retry_delay, MAX_ATTEMPTS
+from common import querycache
+from plugins import config_params
+
+# the value of the count: param (see common/constants.py)
+COUNT_ESTIMATE = 'estimate'
+
+# max number of requests sent in one batch (gmail recommends to keep it at most 50)
+BATCH_SIZE = 50
+# max number of messages returned by one messages.list call
+PAGE_SIZE = 500
 
 def get_config_key():
     return 'gmail-filter'
 
 def get_config_params():
-    return [LABEL, TAB, QUERY]
+    return config_params(get_config_key())
 
-# takes a list of gmail queries, queries gmail and returns a map of aggregated results
-# output: {'tab to which to add the results': ['label', num of messages satisgying the filter, 'link to the gmail satisfying the filter']}
-def execute(config):
-    creds = authenticate_google()
+def is_estimate(config):
+    return config.get(COUNT, '') == COUNT_ESTIMATE
+
+def list_request(service, query, estimate, pageToken):
+    if estimate:
+        return service.users().threads().list(userId='me', q=query, maxResults=1, includeSpamTrash=False, fields='resultSizeEstimate')
+    # the thread ids are all what is needed to count the unique threads
+    return service.users().messages().list(userId='me', q=query, maxResults=PAGE_SIZE, includeSpamTrash=False, pageToken=pageToken, fields='messages/threadId,nextPageToken')
+
+# Counts the threads satisfying the queries. All the queries are sent together using the batch requests, the ones which
+# have more pages are sent again in the next batch with the next page token until all of them are done.
+# The requests of the batch which fail because gmail is overloaded are sent again in the next batch after a backoff.
+# queries: list of (query, estimate) tuples
+# returns: dict of (query, estimate) -> number of threads
+def count_threads(queries):
+    service = google_service('gmail', 'v1')
+    counts = {}
+    threads = {}
+    # (query, estimate) -> the token of the page to load next (None for the first page)
+    pending = {query: None for query in queries}
+    # (query, estimate) -> how many times the current page has failed
+    failures = {}
+    while len(pending) > 0:
+        errors = []
+        delays = []
+        nextPending = {}
+        pendingQueries = list(pending)
+
+        def callback(requestId, response, exception):
+            query = pendingQueries[int(requestId)]
+            if exception is not None:
+                failures[query] = failures.get(query, 0) + 1
+                retry = retry_delay(exception, failures[query] - 1)
+                if retry is None or failures[query] >= MAX_ATTEMPTS:
+                    errors.append(exception)
+                else:
+                    delays.append(retry[0])
+                    nextPending[query] = pending[query]
+                return
+            failures.pop(query, None)
+            if query[1]:
+                counts[query] = response.get('resultSizeEstimate', 0)
+                return
+            threads.setdefault(query, set()).update(msg['threadId'] for msg in response.get('messages', []))
+            if 'nextPageToken' in response:
+                nextPending[query] = response['nextPageToken']
+            else:
+                counts[query] = len(threads.pop(query))
+
+        for start in range(0, len(pendingQueries), BATCH_SIZE):
+            batch = service.new_batch_http_request(callback=callback)
+            batchIds = range(start, min(start + BATCH_SIZE, len(pendingQueries)))
+            for requestId in batchIds:
+                query = pendingQueries[requestId]
+                batch.add(list_request(service, query[0], query[1], pending[query]), request_id=str(requestId))
+            call('gmail', 'list', batch.execute, requests=len(batchIds))
+
+        if len(errors) > 0:
+            raise errors[0]
+        if len(delays) > 0:
+            logging.warning(f'{len(delays)} gmail requests failed, trying again in {max(delays):.1f}s')
+            time.sleep(max(delays))
+        pending = nextPending
+
+    return counts
+
+def to_result(config, numOfThreads):
+    if numOfThreads == 0:
+        return []
 
     label = formatted_label_from_config(config)
-    query = config[QUERY]
-    gmailService = build('gmail', 'v1', credentials=creds, cache_discovery=False)
-        
-    results = gmailService.users().messages().list(userId='me', q=query, maxResults=100, includeSpamTrash=False).execute()
-    msgs = results.get('messages', [])
-
-    if msgs:
-        uniqueThreads = len(set([msg['threadId'] for msg in msgs]))
-        return [label, f'=HYPERLINK(\"https://mail.google.com/mail/u/1/#search/{query}\", \"{uniqueThreads}\")']
-    else:
-        return []
\ No newline at end of file
+    count = f'~{numOfThreads}' if is_estimate(config) else f'{numOfThreads}'
+    return [label, f'=HYPERLINK(\"https://mail.google.com/mail/u/1/#search/{config[QUERY]}\", \"{count}\")']
+
+def cache_key(config):
+    return (querycache.normalize_query(config[QUERY]), is_estimate(config))
+
+# takes a gmail query, queries gmail and returns the number of threads satisfying it
+# output: ['label', 'link to the gmail satisfying the filter with the num of threads as the text']
+def execute(config):
+    return execute_batch([config])[0]
+
+# same as execute but for all the gmail filters at once, sending them together in batch requests
+def execute_batch(configs):
+    counts = querycache.fetch_many(get_config_key(), [cache_key(config) for config in configs], ['threadId'], count_threads)
+    return [to_result(config, numOfThreads) for config, numOfThreads in zip(configs, counts)]
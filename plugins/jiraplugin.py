@@ -1,96 +1,207 @@
-import sys
-import getopt
-from datetime import datetime
-import time
-import dateutil.parser
-from functools import reduce
-
-from jira import JIRA
+from datetime import datetime, timedelta, timezone
+import logging
+from concurrent.futures import ThreadPoolExecutor
 import re
 
-from common.constants import TAB, LABEL, SPLIT_BY, QUERY, ID, STATEFUL, TIMESTAMP, RES, IGNORE_FIELDS, RESTRICT_TIME, MENTIONS, SPLIT
+from common.constants import TAB, LABEL, QUERY, TIMESTAMP, RES, CHANGES, IGNORE_FIELDS, RESTRICT_TIME, MENTIONS, SPLIT, MAX_RESULTS, STATEFUL
 from common.formatting import formatted_label_from_config
-from common.helpers import split_issues, split_array_from_config
+from common.helpers import split_issues, split_array_from_config, split_dimensions
+from common.links import key_list_urls, key_links
+from common import clients, credentials, querycache
+from plugins import config_params
 
 # dependencies:
 # pip install jira
+# (imported only when the plugin logs in to jira)
 
-MAX_RESULTS = 'maxResults:'
 JIRA_BASE_URL = 'https://issues.redhat.com'
+# e.g. 2021-03-04T10:20:30.000+0100
+JIRA_TIME_FORMAT = '%Y-%m-%dT%H:%M:%S.%f%z'
+# how many issues are loaded by one request
+PAGE_SIZE = 100
+# without the changelog and with only a couple of fields the issues are small so more of them can be loaded by one request
+# (jira may still return less, than the actual size of the page is taken from the response)
+RECORDS_PAGE_SIZE = 1000
+# how many pages of one search are loaded at the same time
+PAGE_WORKERS = 4
+# the restrictTime: values which are also fields of the issues, the stateful filters using them can be loaded together
+BATCHABLE_RESTRICT_TIMES = {'updated', 'created'}
 
 def get_config_key():
     return 'jira-filter'
 
 def get_config_params():
-    return [LABEL, TAB, QUERY, SPLIT_BY, MAX_RESULTS, IGNORE_FIELDS, MENTIONS, ID, STATEFUL, RESTRICT_TIME, TIMESTAMP, SPLIT]
+    return config_params(get_config_key())
 
-# for example fields.status.name
-def rgetattr(obj, attr, *args):
-    def _getattr(obj, attr):
+def get_required_params():
+    return [LABEL, TAB, QUERY, MAX_RESULTS]
+
+# the required params which can be empty: a stateful filter without a query watches all the issues
+def get_empty_params(config):
+    return [QUERY] if config.get(STATEFUL, 'false') == 'true' else []
+
+# called when the config is loaded, returns what is wrong with the filter
+def validate_config(config):
+    if not config.get(MAX_RESULTS, '').isdigit():
+        return [f'{MAX_RESULTS} needs to be a number']
+    return []
+
+# the json contains objects (e.g. status, component) where the value shown to the user is their name
+def name_of(value):
+    if isinstance(value, dict):
+        return value.get('name', value.get('value', str(value)))
+    if isinstance(value, list):
+        return [name_of(item) for item in value]
+    return value
+
+# for example fields.status.name on the json of an issue
+def rget(obj, path):
+    for attr in path.split('.'):
         if obj is None:
             return ''
-        return getattr(obj, attr, *args)
-    return reduce(_getattr, [obj] + attr.split('.'))
+        obj = obj.get(attr)
+    return name_of(obj)
+
+# the jira fields which need to be loaded to get the values of the splitBy (e.g. fields.status.name needs the status)
+def needed_fields(dimensions):
+    fields = []
+    for dimension in dimensions:
+        path = dimension.split('.')
+        if len(path) > 1 and path[0] == 'fields' and path[1] not in fields:
+            fields.append(path[1])
+    return fields
 
 def escape_query(query):
     return query.replace('"', '""').replace('&', '%26')
 
-def create_query(issueIds):
-    baseJql = f'{JIRA_BASE_URL}/issues/?jql='
-    issuesJql = ''
-    for i, issueId in enumerate(issueIds):
-        if i != len(issueIds) - 1:
-            issuesJql = issuesJql + f'key={issueId} or '
-        else:
-            issuesJql = issuesJql + f'key={issueId}'
-    return f'{baseJql}{escape_query(issuesJql)}'
+# the urls of the jira searches listing the issues with the given keys
+create_queries = key_list_urls(f'{JIRA_BASE_URL}/issues/?jql=key in (', ',', ')')
 
 def init_jira():
-    try:
-        opts, args = getopt.getopt(sys.argv[1:], "", ["jiratoken="])
-    except getopt.GetoptError:
+    jiratoken = credentials.jira_token()
+    if jiratoken is None:
         print('Jira credentials not provided, ignoring plugin. In order to execute the jira plugin, please run the python main.py --jiratoken <jira token>')
-        return []
+        return None
+
+    from jira import JIRA
+    try:
+        # jira likes to fail from time to time and next time it passes, the call retries it
+        client = clients.call('jira', 'login', lambda: JIRA(server=JIRA_BASE_URL, token_auth=jiratoken))
+        client._session.hooks['response'].append(clients.count_response)
+        return client
+    except Exception as e:
+        logging.error(f'Login to jira failed, ignoring plugin: {e}')
+        return None
+
+
+def jira():
+    return clients.get('jira', init_jira)
+
+# Loads the issues satisfying the jql (at most maxResults of them) as (key, (values of the dimensions)) records.
+# Only the fields needed for the dimensions are loaded. Once the first page tells how many issues there are,
+# the rest of the pages is loaded concurrently.
+def search_records(jql, maxResults, dimensions, fields):
+    maxResults = int(maxResults)
+    # jira returns all the fields if none is asked for, the key is always returned
+    fieldsParam = ','.join(fields) if len(fields) > 0 else 'key'
+
+    def load_page(startAt, pageSize):
+        return clients.call('jira', 'search', lambda: jira().search_issues(jql, startAt=startAt, maxResults=pageSize, fields=fieldsParam, json_result=True), len(jql), clients.received_size)
 
-    for opt, arg in opts:
-      if opt in ("--jiratoken"):
-        jiratoken = arg
-    for _ in range(3):
-        try:
-            return JIRA(server=JIRA_BASE_URL, token_auth=jiratoken)
-        except:
-            # jira likes to fail from time to time and next time it passes. Lets try 3 times
-            print('longin to jira failed, trying again in 2 seconds')
-            time.sleep(2)
+    def to_records(page):
+        return [(issue['key'], tuple(rget(issue, dimension) for dimension in dimensions)) for issue in page.get('issues', [])]
 
+    firstPage = load_page(0, min(RECORDS_PAGE_SIZE, maxResults))
+    records = to_records(firstPage)
+    total = min(firstPage.get('total', 0), maxResults)
+    pageSize = len(records)
+    if pageSize == 0 or pageSize >= total:
+        return records
+
+    with ThreadPoolExecutor(max_workers=PAGE_WORKERS) as executor:
+        for page in executor.map(lambda startAt: to_records(load_page(startAt, min(pageSize, total - startAt))), range(pageSize, total, pageSize)):
+            records.extend(page)
+    return records
 
 def execute(config):
-    issues = init_jira().search_issues(config[QUERY], maxResults=config[MAX_RESULTS])
+    return execute_batch([config])[0]
+
+# Executes the configs of one group returned by batch_groups, all with the same query and maxResults: the issues are
+# searched once with the fields needed by all of them and each config splits them by its own dimensions.
+def execute_batch(configs):
+    query = configs[0][QUERY]
+    maxResults = configs[0][MAX_RESULTS]
+    dimensions = sorted(set().union(*(split_dimensions(config) for config in configs)))
+    dimensionIndex = {dimension: index for index, dimension in enumerate(dimensions)}
+    fields = needed_fields(dimensions)
+    issues = querycache.fetch(
+        get_config_key(),
+        (querycache.normalize_query(query), maxResults),
+        dimensions,
+        lambda: search_records(query, maxResults, dimensions, fields))
 
-    return split_issues(
+    return [split_issues(
         config,
         issues,
         f'{JIRA_BASE_URL}/issues/?jql={escape_query(config[QUERY])}',
-        create_query,
-        lambda issue: issue.key,
-        rgetattr)
+        create_queries,
+        lambda issue: issue[0],
+        lambda issue, splitBy: issue[1][dimensionIndex[splitBy]]) for config in configs]
+
+# loads the issues satisfying the jql (at most maxResults of them) page by page
+def search_all(jql, maxResults, **kwargs):
+    maxResults = int(maxResults)
+    startAt = 0
+    while startAt < maxResults:
+        page = clients.call('jira', 'search', lambda: jira().search_issues(jql, startAt=startAt, maxResults=min(PAGE_SIZE, maxResults - startAt), **kwargs), len(jql), clients.received_size)
+        yield from page
+        startAt += len(page)
+        if len(page) == 0 or startAt >= page.total:
+            return
 
 def to_timestamp(str):
-    dt = dateutil.parser.parse(str)
+    try:
+        # way faster than the dateutil and jira always sends this format
+        dt = datetime.strptime(str, JIRA_TIME_FORMAT)
+    except ValueError:
+        import dateutil.parser
+        dt = dateutil.parser.parse(str)
     return datetime.timestamp(dt)
 
+# formats the timestamp the same way jira does in the timezone given by the utc offset (e.g. +0100)
+def to_jira_time(timestamp, utcOffset):
+    mo = re.fullmatch(r'([+-])(\d\d)(\d\d)', utcOffset)
+    if not mo:
+        return None
+    offset = timedelta(hours=int(mo.group(2)), minutes=int(mo.group(3)))
+    # jira has millisecond precision, the timestamps have been parsed from it so rounding gives the original value
+    millis = round(timestamp * 1000)
+    dt = datetime.fromtimestamp(millis // 1000, timezone(offset if mo.group(1) == '+' else -offset))
+    return dt.strftime('%Y-%m-%dT%H:%M:%S.') + f'{millis % 1000:03d}{utcOffset}'
+
+# Returns a function which tells if a jira time (e.g. 2021-03-04T10:20:30.000+0100) is after the timestamp.
+# Jira sends all the times in the same timezone so instead of parsing each of them, they are compared as strings
+# with the timestamp formatted the same way (once per utc offset).
+def newer_than(timestamp):
+    thresholds = {}
+    def isNewer(jiraTime):
+        utcOffset = jiraTime[-5:]
+        if utcOffset not in thresholds:
+            thresholds[utcOffset] = to_jira_time(timestamp, utcOffset)
+        threshold = thresholds[utcOffset]
+        if threshold is None or len(threshold) != len(jiraTime):
+            # some unexpected format, needs to be parsed
+            return to_timestamp(jiraTime) > timestamp
+        return jiraTime > threshold
+    return isNewer
+
 # Converts a float timestamp to a sting which can be used as a JQL param
 def to_query_time(timestamp):
     dt = datetime.fromtimestamp(timestamp)
     return dt.strftime("%Y/%m/%d %H:%M")
 
-def format_list_of_jira_keys(keys):
-    res = ''
-    for key in keys:
-        res = res + f'"{create_query([key])}", '
-
-    return res
-
+# parses the issues which have changed from the row printed by the previous versions which kept the state in the spreadsheet
+# used only to import that state
 def parse_prev_row(prevRows):
     r = r'.*=HYPERLINK.*, "(.*): " \& COUNTA\((.*), \)\)'
     res = {}
@@ -101,48 +212,111 @@ def parse_prev_row(prevRows):
             issues = mo.group(2).split(', ')
 
             if issueType not in res:
-                res[issueType] = []
+                res[issueType] = {}
 
             for issue in issues:
                 # dont want to use a regex here since this is way faster
                 issueKey = issue[len(JIRA_BASE_URL + '/issues/?jql=key=') + 1: len(issue) - 1]
-                res[issueType].append(issueKey)
+                res[issueType][issueKey] = True
 
     return res
 
-def execute_stateful(config, prevRow, lastExecutedTs):
-    ignoreFields = split_array_from_config(config, IGNORE_FIELDS)
-    mentionsFields = split_array_from_config(config,MENTIONS)
-    restrictTime = config.get(RESTRICT_TIME, 'updated')
-    split = config.get(SPLIT, 'true')
+# the fields of the issues which the stateful filter needs to load
+def stateful_fields(config):
+    if config.get(SPLIT, 'true') != 'false' and track_mentions(config):
+        return {'comment'}
+    return {'updated'}
+
+def track_mentions(config):
+    return 'mention' not in split_array_from_config(config, IGNORE_FIELDS) and len(split_array_from_config(config, MENTIONS)) > 0
 
-    fieldToListOfChanges = parse_prev_row(prevRow)
+# the issues satisfying the query of the stateful filter which have changed (by the restrictTime) since the timestamp
+def search_changed(config, lastExecutedTs, fields):
+    restrictTime = config.get(RESTRICT_TIME, 'updated')
     jql = config[QUERY]
     if len(jql.strip()) > 0:
         jql = jql + ' and '
     jql = f'{jql}{restrictTime} > "{to_query_time(lastExecutedTs)}"'
+    if config.get(SPLIT, 'true') == 'false':
+        # only the list of the changed issues is needed, not what has changed on them
+        return search_all(jql, config[MAX_RESULTS], fields=','.join(sorted(fields)))
+    return search_all(jql, config[MAX_RESULTS], expand='changelog', fields=','.join(sorted(fields)))
 
-    # todo: if the "split" is false, the exapands here are not needed
-    issues = init_jira().search_issues(jql, maxResults=config[MAX_RESULTS], expand='changelog', fields = 'comment')
-    lastTimestampFromResults = lastExecutedTs
+# prevChanges: {field: {issue key: True}} of the changes collected by the previous runs
+def execute_stateful(config, prevChanges, lastExecutedTs):
+    return collect_changes(config, prevChanges, lastExecutedTs, search_changed(config, lastExecutedTs, stateful_fields(config)))
+
+# Groups the filters executed by one search.
+# The stateful filters which differ only in when they have been executed the last time are loaded by one search since
+# the oldest of them and split back to the filters by the restrictTime of the issues, so only the restrictTime values
+# which are also fields of the issue can be grouped. The other filters are grouped by their query and maxResults.
+def batch_groups(configs):
+    groups = {}
+    singles = []
+    for config in configs:
+        if config.get(STATEFUL, 'false') != 'true':
+            groups.setdefault((querycache.normalize_query(config[QUERY]), config[MAX_RESULTS]), []).append(config)
+            continue
+        restrictTime = config.get(RESTRICT_TIME, 'updated')
+        if restrictTime not in BATCHABLE_RESTRICT_TIMES:
+            singles.append([config])
+            continue
+        key = (querycache.normalize_query(config[QUERY]), restrictTime, config.get(SPLIT, 'true') == 'false', config[MAX_RESULTS])
+        groups.setdefault(key, []).append(config)
+    return list(groups.values()) + singles
+
+# items: [(config, prevChanges, lastExecutedTs)] of one group returned by batch_groups
+def execute_stateful_batch(items):
+    if len(items) == 1:
+        return [execute_stateful(*items[0])]
+
+    config = items[0][0]
+    restrictTime = config.get(RESTRICT_TIME, 'updated')
+    fields = set().union(*(stateful_fields(itemConfig) for itemConfig, _, _ in items)) | {restrictTime}
+    issues = list(search_changed(config, min(lastExecutedTs for _, _, lastExecutedTs in items), fields))
+    if len(issues) >= int(config[MAX_RESULTS]):
+        # the newest changes of some of the filters could have been cut off by the maxResults, each needs its own search
+        logging.info(f'The stateful jira search for {len(items)} filters has reached {MAX_RESULTS} {config[MAX_RESULTS]}, executing them one by one')
+        return [execute_stateful(*item) for item in items]
 
+    def execute_item(itemConfig, prevChanges, lastExecutedTs):
+        # the same issues as the jql of the filter itself would return, it compares with the minute precision
+        isInWindow = newer_than(lastExecutedTs - lastExecutedTs % 60)
+        return collect_changes(itemConfig, prevChanges, lastExecutedTs, issues, lambda issue: isInWindow(getattr(issue.fields, restrictTime)))
+    return [execute_item(*item) for item in items]
+
+# Collects the changes of the issues loaded by search_changed into the result of execute_stateful.
+# If the issues have been loaded for an older timestamp (shared by more filters), inWindow tells which of them
+# the filter would have loaded by itself.
+def collect_changes(config, prevChanges, lastExecutedTs, issues, inWindow = None):
+    ignoreFields = split_array_from_config(config, IGNORE_FIELDS)
+    mentionsFields = split_array_from_config(config,MENTIONS)
+    split = config.get(SPLIT, 'true')
+
+    # field -> issue keys which have changed it. The keys are kept in a dict which is used as an ordered set
+    # so that the output does not change its order between runs
+    fieldToListOfChanges = {field: dict(keys) for field, keys in prevChanges.items()}
+
+    lastTimestampFromResults = lastExecutedTs
+    isNewer = newer_than(lastExecutedTs)
+    if inWindow is not None:
+        issues = (issue for issue in issues if inWindow(issue))
 
     if split == 'false':
-        fieldToListOfChanges['all'] = []
+        fieldToListOfChanges['all'] = {}
         for issue in issues:
-            for history in issue.changelog.histories:
-                ts = to_timestamp(history.created)
-                if ts > lastTimestampFromResults:
-                    lastTimestampFromResults = ts
-            fieldToListOfChanges['all'].append(issue.key)
+            if isNewer(issue.fields.updated):
+                lastTimestampFromResults = max(lastTimestampFromResults, to_timestamp(issue.fields.updated))
+            fieldToListOfChanges['all'][issue.key] = True
     else:
+        trackMentions = track_mentions(config)
         for issue in issues:
             for history in issue.changelog.histories:
-                ts = to_timestamp(history.created)
-                if ts <= lastExecutedTs:
+                if not isNewer(history.created):
                     # something has changed on this issue (otherwise it would not be loaded) but this particular change happend before the last time this has been executed
                     # so no need to show it
                     continue
+                ts = to_timestamp(history.created)
                 if ts > lastTimestampFromResults:
                     lastTimestampFromResults = ts
                 for item in history.items:
@@ -150,23 +324,20 @@ def execute_stateful(config, prevRow, lastExecutedTs):
                     if f in ignoreFields:
                         continue
                     if f not in fieldToListOfChanges:
-                        fieldToListOfChanges[f] = []
-                    if issue.key not in fieldToListOfChanges[f]:
-                        fieldToListOfChanges[f].append(issue.key)
+                        fieldToListOfChanges[f] = {}
+                    fieldToListOfChanges[f][issue.key] = True
 
-            mention = 'mention'
-            if mention not in ignoreFields and len(mentionsFields) > 0:
+            if trackMentions:
                 for c in issue.fields.comment.comments:
-                    if to_timestamp(c.created) <= lastExecutedTs:
+                    if not isNewer(c.created):
                         # too old, skip...
                         continue
                     for mentionsField in mentionsFields:
                         mentionKey = f'{mentionsField} mentioned'
                         if mentionKey not in fieldToListOfChanges:
-                            fieldToListOfChanges[mentionKey] = []
+                            fieldToListOfChanges[mentionKey] = {}
                         if f'[~{mentionsField}]' in c.body:
-                            if issue.key not in fieldToListOfChanges[mentionKey]:
-                                fieldToListOfChanges[mentionKey].append(issue.key)
+                            fieldToListOfChanges[mentionKey][issue.key] = True
 
     res = []
     if len(fieldToListOfChanges) > 0:
@@ -174,7 +345,6 @@ def execute_stateful(config, prevRow, lastExecutedTs):
     for field in fieldToListOfChanges:
         if len(fieldToListOfChanges[field]) == 0:
             continue
-        linkWithCount = f'=HYPERLINK("{create_query(fieldToListOfChanges[field])}", "{field}: " & COUNTA({format_list_of_jira_keys(fieldToListOfChanges[field])}))'
-        res.append(linkWithCount)
+        res.extend(key_links(create_queries(fieldToListOfChanges[field]), field, len(fieldToListOfChanges[field])))
 
-    return {TIMESTAMP: lastTimestampFromResults, RES: res}
\ No newline at end of file
+    return {TIMESTAMP: lastTimestampFromResults, RES: res, CHANGES: fieldToListOfChanges}
\ No newline at end of file